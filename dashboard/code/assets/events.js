@@ -0,0 +1,19 @@
+// assets/events.js
+// Passes server-sent change events into the 'server-events' store, where
+// the clientside callback in callbacks.py applies them to the page
+(function() {
+  if (!window.EventSource) {
+    return;
+  }
+  const source = new EventSource('/events');
+  source.onmessage = function(e) {
+    if (!(window.dash_clientside && window.dash_clientside.set_props)) {
+      return;
+    }
+    try {
+      window.dash_clientside.set_props('server-events', {data: JSON.parse(e.data)});
+    } catch (err) {
+      // the store is not in the layout yet, e.g. while the page loads
+    }
+  };
+})();
@@ -0,0 +1,226 @@
+// assets/ui.js
+// Clientside callbacks which only compute UI state from data already in
+// the browser, registered in callbacks.py with ClientsideFunction('ui', ...)
+(function() {
+  const SECONDARY = 'secondary';
+  // same as figures.TOOLTIP_MIN_LENGTH
+  const TOOLTIP_MIN_LENGTH = 16;
+
+  // x to two decimals as Python formats it: toFixed rounds exact halves
+  // up, Python to even. A size over a power of 1024 is exact, so halves are
+  // found exactly
+  function toFixed2(x) {
+    const scaled = x * 100;
+    const floor = Math.floor(scaled);
+    if (scaled - floor === 0.5 && floor % 2 === 0) {
+      return (floor / 100).toFixed(2);
+    }
+    return x.toFixed(2);
+  }
+
+  // same output as ui.format_size
+  function formatSize(bytes) {
+    for (const unit of ['B', 'KB', 'MB', 'GB', 'TB', 'PB']) {
+      if (bytes < 1024) {
+        return `${toFixed2(bytes)} ${unit}`;
+      }
+      bytes /= 1024;
+    }
+  }
+
+  function selectedSize(selected) {
+    return selected.reduce((size, row) => size + row.size, 0);
+  }
+
+  function totalTitle(label) {
+    return function(state) {
+      return `${label}: ${state ? state.total : 0}`;
+    };
+  }
+
+  function distinct(records, column, isArray) {
+    const values = new Set();
+    for (const record of records) {
+      const value = record[column];
+      if (value === null || value === undefined) {
+        continue;
+      }
+      (isArray ? value : [value]).forEach(v => values.add(v));
+    }
+    return Array.from(values).sort();
+  }
+
+  function overlaps(values, selected) {
+    return !selected || selected.length === 0
+      || (values || []).some(v => selected.includes(v));
+  }
+
+  function contains(value, text) {
+    return !text || String(value).toLowerCase().includes(text.toLowerCase());
+  }
+
+  // substring matches on name and UUID, any of the selected values for
+  // the other filters
+  function matches(record, f) {
+    return contains(record.name, f.name)
+      && contains(record.uuid, f.uuid)
+      && (!f.domain || f.domain.length === 0 || f.domain.includes(record.model_domain))
+      && overlaps(record.filename_extensions, f.extensions)
+      && (!f.relation || f.relation.length === 0 || f.relation.includes(record.relation_type))
+      && overlaps(record.produced_by, f.produced_by)
+      && overlaps(record.ingested_by, f.ingested_by)
+      && overlaps(record.modified_by, f.modified_by)
+      && (f.gis !== 'true' && f.gis !== 'false' || record.gis === (f.gis === 'true'));
+  }
+
+  // a table row from a catalogue record, with lists joined as the server
+  // side tables show them, and tooltips for the visible cells which may be
+  // cut off
+  function tableRow(record, hidden) {
+    const row = {}, tooltip = {};
+    for (const [column, value] of Object.entries(record)) {
+      const text = Array.isArray(value) ? value.join(', ') : value;
+      row[column] = text;
+      if (!hidden.has(column) && text !== null && text !== undefined
+          && String(text).length >= TOOLTIP_MIN_LENGTH) {
+        tooltip[column] = {value: String(text), type: 'text'};
+      }
+    }
+    return [row, tooltip];
+  }
+
+  window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    ui: {
+      filesTitle: totalTitle('Associated Files'),
+      spatialSearchTitle: totalTitle('Spatial Search'),
+      textSearchTitle: totalTitle('Search Results'),
+
+      downloadTitle: function(selected) {
+        if (!selected) {
+          return window.dash_clientside.no_update;
+        }
+        return `ℹ️ ${selected.length}`;
+      },
+
+      selectionButtons: function(selected) {
+        if (!selected || selected.length === 0) {
+          return [true, true, true, SECONDARY, SECONDARY, SECONDARY];
+        }
+        if (selected.length === 1) {
+          return [false, false, false, 'primary', 'primary', 'danger'];
+        }
+        // only allow delete button for one file at a time
+        return [false, false, true, 'primary', 'primary', SECONDARY];
+      },
+
+      estimatedSize: function(selected) {
+        if (!selected) {
+          return window.dash_clientside.no_update;
+        }
+        return `Estimated size: ${formatSize(selectedSize(selected))}`;
+      },
+
+      downloadButton: function(selected) {
+        const count = selected ? selected.length : 0;
+        if (count > 10) {
+          return ['Download MAXIMUM EXCEEDED (10 Files)', true, SECONDARY];
+        }
+        if (count > 0) {
+          return [`Download (${formatSize(selectedSize(selected))})`, false, 'primary'];
+        }
+        return ['Download 0B', true, SECONDARY];
+      },
+
+      uploadName: function(filename) {
+        if (filename !== null && filename !== undefined) {
+          return `Selected: ${filename}`;
+        }
+        return {
+          namespace: 'dash_html_components',
+          type: 'Div',
+          props: {
+            children: [
+              'Drag and Drop or ',
+              {namespace: 'dash_html_components', type: 'A', props: {children: 'Select Files'}}
+            ]
+          }
+        };
+      },
+
+      uploadButton: function(filename, selected_rows) {
+        if (filename !== null && filename !== undefined
+            && selected_rows && selected_rows.length > 0) {
+          return [false, 'primary'];
+        }
+        return [true, SECONDARY];
+      },
+
+      // the selected files of every page, in the order they were selected:
+      // those of other pages are kept, and those of this page replaced by
+      // its selected rows
+      selectedFiles: function(selected_rows, data, selected) {
+        const page = new Set((data || []).map(row => row.uuid));
+        const rows = (selected_rows || []).map(i => data[i]);
+        const chosen = new Map(rows.map(row => [row.uuid, row]));
+        const kept = (selected || []).filter(
+          row => !page.has(row.uuid) || chosen.has(row.uuid)
+        ).map(row => chosen.get(row.uuid) || row);
+        const before = new Set(kept.map(row => row.uuid));
+        const result = kept.concat(rows.filter(row => !before.has(row.uuid)));
+        const unchanged = result.length === (selected || []).length
+          && result.every((row, i) => row.uuid === selected[i].uuid);
+        return unchanged ? window.dash_clientside.no_update : result;
+      },
+
+      catalogueOptions: function(store) {
+        const records = store ? store.records : [];
+        return [
+          distinct(records, 'model_domain', false),
+          distinct(records, 'filename_extensions', true),
+          distinct(records, 'relation_type', false),
+          distinct(records, 'produced_by', true),
+          distinct(records, 'ingested_by', true),
+          distinct(records, 'modified_by', true),
+        ];
+      },
+
+      filterCatalogue: function(store, n, name, uuid, domain, extensions,
+                                relation, produced_by, ingested_by,
+                                modified_by, gis, hidden_columns,
+                                selected_rows, data) {
+        const filters = {
+          name, uuid, domain, extensions, relation, produced_by, ingested_by,
+          modified_by, gis
+        };
+        const hidden = new Set(hidden_columns || []);
+        const rows = [], tooltips = [];
+        for (const record of (store ? store.records : [])) {
+          if (matches(record, filters)) {
+            const [row, tooltip] = tableRow(record, hidden);
+            rows.push(row);
+            tooltips.push(tooltip);
+          }
+        }
+
+        // keep the selected item selected if it is still shown
+        let selected = [];
+        if (selected_rows && selected_rows.length > 0 && data[selected_rows[0]]) {
+          const index = rows.findIndex(r => r.uuid === data[selected_rows[0]].uuid);
+          selected = index >= 0 ? [index] : [];
+        }
+        const unchanged = selected.length === (selected_rows || []).length
+          && (selected.length === 0 || selected[0] === selected_rows[0]);
+        return [
+          rows,
+          tooltips,
+          unchanged ? window.dash_clientside.no_update : selected,
+          `Results: ${rows.length}`
+        ];
+      },
+
+      showHelp: function(n) {
+        return true;
+      }
+    }
+  });
+})();
@@ -0,0 +1,269 @@
+import os
+import glob
+import json
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Buffers audit records in memory and writes them to PostgreSQL in
+    batches from a background thread.
+
+    Every record is appended to a per-process journal file before it is
+    queued. On flush the queue and journal are swapped out together, so a
+    journal segment only ever holds records which have not been committed.
+    Segments are deleted after the batch commits and otherwise left on disk
+    to be replayed, which covers worker crashes, shutdown and database
+    outages.
+
+    A batch the database rejects, e.g. for a constraint violation, is
+    written again one record at a time, so one bad record does not hold
+    back the others. Records which are still rejected are moved to a
+    quarantine file in the spill directory and logged.
+    """
+
+    def __init__(self, app=None):
+        self._engine = None
+        self._metadata = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = []
+        self._journal = None
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._spilled = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # db must be initialised before the audit writer
+        sqla = app.extensions['sqlalchemy']
+        with app.app_context():
+            self._engine = sqla.engine
+        self._metadata = sqla.metadata
+        self.batch_size = app.config['AUDIT_BATCH_SIZE']
+        self.flush_interval = app.config['AUDIT_FLUSH_INTERVAL']
+        self.spill_dir = app.config['AUDIT_SPILL_DIR']
+        os.makedirs(self.spill_dir, exist_ok=True)
+        atexit.register(self.close)
+
+    def record(self, table, **values):
+        values.setdefault('insert_time', datetime.now(timezone.utc))
+        line = json.dumps({'table': table, 'values': values}, default=_encode)
+        with self._lock:
+            self._ensure_started()
+            self._journal.write(line + '\n')
+            self._journal.flush()
+            self._pending.append((table, values))
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+
+    def close(self):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join(timeout=30)
+
+    def _ensure_started(self):
+        # called with the lock held. The thread is started lazily so that it
+        # belongs to the gunicorn worker rather than a preloading master
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._pending = []
+        self._stopping = False
+        if os.path.exists(self._journal_path()):
+            # left behind by an earlier process which had the same pid
+            os.replace(self._journal_path(), self._segment_path())
+        self._journal = open(self._journal_path(), 'a', encoding='utf-8')
+        self._thread = threading.Thread(
+            target=self._run, name='audit-writer', daemon=True
+        )
+        self._thread.start()
+
+    def _journal_path(self):
+        return os.path.join(self.spill_dir, f"audit-{self._pid}.journal")
+
+    def _segment_path(self):
+        return os.path.join(
+            self.spill_dir, f"audit-{self._pid}-{time.time_ns()}.pending"
+        )
+
+    def _rotate(self):
+        # called with the lock held; returns the segment holding exactly the
+        # records in the batch being taken
+        batch, self._pending = self._pending, []
+        self._journal.close()
+        segment = self._segment_path()
+        os.replace(self._journal_path(), segment)
+        self._journal = open(self._journal_path(), 'a', encoding='utf-8')
+        return batch, segment
+
+    def _run(self):
+        while True:
+            if self._spilled:
+                self._spilled = not self._replay()
+            with self._lock:
+                deadline = time.monotonic() + self.flush_interval
+                while (not self._stopping
+                       and len(self._pending) < self.batch_size
+                       and time.monotonic() < deadline):
+                    self._wakeup.wait(deadline - time.monotonic())
+                stopping = self._stopping
+                batch, segment = self._rotate() if self._pending else ([], None)
+            if batch:
+                remaining = self._write(batch)
+                if not remaining:
+                    os.remove(segment)
+                else:
+                    if len(remaining) < len(batch):
+                        self._keep(remaining, segment)
+                    self._spilled = True
+                    logger.error(
+                        f"audit writer: batch of {len(remaining)} records spilled to {segment}"
+                    )
+            if stopping:
+                with self._lock:
+                    self._journal.close()
+                    if os.path.getsize(self._journal_path()) == 0:
+                        os.remove(self._journal_path())
+                return
+
+    def _write(self, batch):
+        """Write batch, and return the records which are left to retry once
+        the database is reachable again."""
+        try:
+            self._insert(batch)
+            logger.debug(f"audit writer: flushed {len(batch)} records")
+            return []
+        except Exception as e:
+            if _unavailable(e):
+                logger.error(f"audit writer: flush exception, exception: {e}")
+                return batch
+            logger.error(
+                f"audit writer: batch of {len(batch)} records rejected, writing them one at a time, exception: {e}"
+            )
+        for i, record in enumerate(batch):
+            try:
+                self._insert([record])
+            except Exception as e:
+                if _unavailable(e):
+                    logger.error(f"audit writer: flush exception, exception: {e}")
+                    return batch[i:]
+                self._quarantine(record, e)
+        return []
+
+    def _insert(self, batch):
+        rows = {}
+        for table, values in batch:
+            rows.setdefault(table, []).append(values)
+        with self._engine.begin() as conn:
+            for table, values in rows.items():
+                # executemany is sent as multi-row INSERT ... VALUES
+                conn.execute(self._metadata.tables[table].insert(), values)
+
+    def _quarantine(self, record, error):
+        table, values = record
+        path = os.path.join(self.spill_dir, f"quarantine-{os.getpid()}.jsonl")
+        line = json.dumps(
+            {'table': table, 'values': values, 'error': str(error)}, default=_encode
+        )
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+        logger.error(
+            f"audit writer: record quarantined, table: {table}, file: {path}, exception: {error}"
+        )
+
+    def _keep(self, batch, path):
+        # the records left of a segment, replaced in one step. The temporary
+        # name does not match audit-*, so it is never replayed
+        tmp = os.path.join(self.spill_dir, f".{os.path.basename(path)}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for table, values in batch:
+                f.write(json.dumps({'table': table, 'values': values}, default=_encode) + '\n')
+        os.replace(tmp, path)
+
+    def _replay(self):
+        # claim spill files left by this or any dead process. Renaming is
+        # atomic, so two workers starting together cannot replay the same file
+        replayed = True
+        for path in glob.glob(os.path.join(self.spill_dir, 'audit-*')):
+            owner = _owner_pid(path)
+            if path == self._journal_path():
+                continue
+            if owner != self._pid and _pid_alive(owner):
+                continue
+            claimed = f"{path.split('.replay-')[0]}.replay-{self._pid}"
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            batch = self._load(claimed)
+            remaining = self._write(batch) if batch else []
+            if not remaining:
+                os.remove(claimed)
+                logger.info(f"audit writer: replayed {len(batch)} records from {path}")
+            else:
+                if len(remaining) < len(batch):
+                    self._keep(remaining, claimed)
+                replayed = False
+        return replayed
+
+    def _load(self, path):
+        batch = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a torn final line from a crash mid-write
+                    logger.warning(f"audit writer: skipping corrupt line in {path}")
+                    continue
+                table = self._metadata.tables[record['table']]
+                values = record['values']
+                for key, value in values.items():
+                    if value is not None and isinstance(table.c[key].type, DateTime):
+                        values[key] = datetime.fromisoformat(value)
+                batch.append((record['table'], values))
+        return batch
+
+
+def _unavailable(error):
+    # the database could not be reached, as opposed to rejecting the records
+    return (isinstance(error, (OperationalError, InterfaceError, TimeoutError))
+            or getattr(error, 'connection_invalidated', False))
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _owner_pid(path):
+    # audit-<pid>.journal, audit-<pid>-<n>.pending or <either>.replay-<pid>
+    name = os.path.basename(path)
+    if '.replay-' in name:
+        return int(name.rsplit('.replay-', 1)[1])
+    return int(name[len('audit-'):].split('.')[0].split('-')[0])
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
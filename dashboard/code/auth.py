@@ -1,7 +1,10 @@
-from flask import Blueprint, render_template, redirect, request, session, flash
+from flask import Blueprint, render_template, redirect, request, session, flash, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from models import User
-from extensions import login_manager
+from extensions import db, login_manager, change_feed
+from collections import OrderedDict
+import threading
+import time
 import logging
 
 import forms
@@ -11,9 +14,40 @@ auth_bp = Blueprint('auth', __name__)
 
 logger = logging.getLogger(__name__)
 
+# user_id -> (expires, users table version, User). Users are detached from
+# the session before caching so later commits cannot expire them
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    now = time.monotonic()
+    version = change_feed.version(User.__tablename__)
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+        if cached and cached[0] > now and cached[1] == version:
+            _user_cache.move_to_end(user_id)
+            return cached[2]
+
+    user = db.session.get(User, int(user_id))
+    if user is None:
+        invalidate_user(user_id)
+        return None
+    db.session.expunge(user)
+    with _user_cache_lock:
+        _user_cache[user_id] = (now + current_app.config['USER_CACHE_TTL'], version, user)
+        _user_cache.move_to_end(user_id)
+        while len(_user_cache) > current_app.config['USER_CACHE_SIZE']:
+            _user_cache.popitem(last=False)
+    return user
+
+
+def invalidate_user(user_id):
+    """Drop a user from this worker's cache. Changes to the users table
+    made anywhere invalidate every worker's cache through the change feed."""
+    with _user_cache_lock:
+        _user_cache.pop(str(user_id), None)
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -36,6 +70,7 @@ def login():
 def logout():
     db_actions.record_pg_logins('logout', current_user.email)
     logger.info(f"logout, user: {current_user.email}")
+    invalidate_user(current_user.get_id())
     logout_user()
     session.clear()
     return redirect('/login')
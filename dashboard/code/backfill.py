@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from uuid import UUID
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+
+from extensions import db, change_feed
+from models import Objects, DataDict, Layers
+import geo_ingestion
+import geo_pool
+import minio_routes
+
+logger = logging.getLogger(__name__)
+
+JOB = 'backfill_extents'
+# smallest ranged read of a raster header, so the few small reads of a TIFF
+# header are usually answered by one request
+BLOCK_SIZE = 64 * 1024
+
+
+class ObjectReader:
+    """read(offset, length) over an object in MinIO by ranged requests, for
+    the header-only raster readers in geo_ingestion."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.block_offset = None
+        self.block = b''
+        self.bytes_read = 0
+
+    def read(self, offset, length):
+        if (self.block_offset is None or offset < self.block_offset
+                or offset + length > self.block_offset + len(self.block)):
+            response = minio_routes.minio_client.get_object(
+                self.bucket, self.name, offset=offset, length=max(length, BLOCK_SIZE)
+            )
+            try:
+                self.block = response.read()
+            finally:
+                response.close()
+                response.release_conn()
+            self.block_offset = offset
+            self.bytes_read += len(self.block)
+        start = offset - self.block_offset
+        return self.block[start:start + length]
+
+
+def candidates_query(after=None):
+    """Active objects of GIS catalogue items without extents, in a format
+    extents can be extracted from, in uuid order from after."""
+    q = (
+        select(Objects.uuid, Objects.filename, Objects.minio_bucket, Objects.minio_filename)
+        .join(DataDict, DataDict.uuid == Objects.data_dict_uuid)
+        .where(Objects.status == 'active')
+        .where(Objects.spatial_extents.is_(None))
+        .where(DataDict.gis.is_(True))
+        .where(Objects.filename_extension.in_([e[1:] for e in geo_ingestion.EXTENSIONS]))
+        .order_by(Objects.uuid)
+    )
+    if after is not None:
+        q = q.where(Objects.uuid > after)
+    return q
+
+
+def extract(row, pool, raster_crs):
+    """Extents, footprints and layers of one object, and the bytes fetched
+    for it. Rasters are read here from their headers; other files are
+    downloaded to a temporary file and their layers read in the process
+    pool."""
+    if row.filename.endswith(geo_ingestion.RASTER_EXTENSIONS):
+        reader = ObjectReader(row.minio_bucket, row.minio_filename)
+        extents, levels = geo_ingestion.raster(row.filename, reader.read, source_crs=raster_crs)
+        return extents, levels, [], reader.bytes_read
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'object' + os.path.splitext(row.filename)[1])
+        minio_routes.minio_client.fget_object(row.minio_bucket, row.minio_filename, path)
+        size = os.path.getsize(path)
+        extents, levels, layers = geo_ingestion.extract(row.filename, path, 4326, raster_crs, pool)
+    return extents, levels, layers, size
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'after': None, 'succeeded': 0, 'failed': 0}
+
+
+def save_checkpoint(path, checkpoint):
+    # replaced in one step, so an interrupted job never leaves half a file
+    if path:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(path + '.tmp', path)
+
+
+def backfill_extents(batch_size, processes, downloads, checkpoint_path=None):
+    """Compute extents and footprints for the objects of candidates_query,
+    batch_size at a time. Up to downloads objects are fetched from MinIO at
+    once and vector files are read by a pool of processes. Each batch is
+    written in one statement and recorded in the checkpoint, so the job
+    resumes after the last completed batch. Objects which fail are logged
+    and skipped."""
+    raster_crs = current_app.config['RASTER_SOURCE_CRS']
+    checkpoint = load_checkpoint(checkpoint_path)
+    after = UUID(checkpoint['after']) if checkpoint['after'] else None
+    total = db.session.scalar(
+        select(func.count()).select_from(candidates_query(after).order_by(None).subquery())
+    )
+    logger.info(f"backfill_extents: starting, candidates: {total}, after: {after}")
+    click.echo(f"{total} objects to backfill")
+
+    done = 0
+    fetched = 0
+    started = time.monotonic()
+    pool = geo_pool.GeoPool()
+    pool.init_app(current_app)
+    pool.configure(enabled=True, size=processes)
+
+    def run(row):
+        try:
+            return row, extract(row, pool, raster_crs), None
+        except Exception as e:
+            return row, None, e
+
+    try:
+        with ThreadPoolExecutor(downloads) as threads:
+            while True:
+                rows = db.session.execute(candidates_query(after).limit(batch_size)).all()
+                if not rows:
+                    break
+
+                updates = []
+                layers = []
+                for row, result, error in threads.map(run, rows):
+                    if error is not None:
+                        checkpoint['failed'] += 1
+                        logger.warning(
+                            f"backfill_extents: extraction exception, object UUID: {row.uuid}, filename: {row.filename}, exception: {error}"
+                        )
+                        continue
+                    extents, levels, object_layers, size = result
+                    fetched += size
+                    updates.append({'uuid': row.uuid, 'gis': True, 'spatial_extents': extents, **levels})
+                    layers.extend({'object_uuid': row.uuid, **layer} for layer in object_layers)
+                if updates:
+                    db.session.execute(update(Objects), updates)
+                if layers:
+                    db.session.execute(insert(Layers).on_conflict_do_nothing(), layers)
+                done += len(rows)
+                change_feed.publish(db.session.connection(), {
+                    'job': JOB, 'progress': round(done / total, 3) if total else 1
+                })
+                db.session.commit()
+                change_feed.bump(Objects.__tablename__)
+
+                after = rows[-1].uuid
+                checkpoint['after'] = str(after)
+                checkpoint['succeeded'] += len(updates)
+                save_checkpoint(checkpoint_path, checkpoint)
+
+                elapsed = time.monotonic() - started
+                click.echo(
+                    f"{done}/{total} objects, {checkpoint['succeeded']} backfilled, "
+                    f"{checkpoint['failed']} failed, {done / elapsed:.1f} objects/s, "
+                    f"{fetched / elapsed / 2 ** 20:.1f} MB/s"
+                )
+    finally:
+        pool.close()
+
+    logger.info(
+        f"backfill_extents: finished, objects: {done}, succeeded: {checkpoint['succeeded']}, failed: {checkpoint['failed']}, seconds: {time.monotonic() - started:.1f}"
+    )
+    return checkpoint
+
+
+def register_commands(app):
+    @app.cli.command('backfill-extents')
+    @click.option('--batch-size', default=100, show_default=True, help='Objects read and written at a time.')
+    @click.option('--processes', default=os.cpu_count(), show_default=True, help='Processes reading vector files.')
+    @click.option('--downloads', default=8, show_default=True, help='Objects fetched from MinIO at once.')
+    @click.option('--checkpoint', default='backfill_extents.json', show_default=True, help="Progress file, '' for none.")
+    @click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first object.')
+    def backfill_extents_command(batch_size, processes, downloads, checkpoint, restart):
+        """Compute spatial extents for objects which have none."""
+        if restart and checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        backfill_extents(batch_size, processes, downloads, checkpoint)
@@ -6,11 +6,11 @@ import pandas as pd
 import json
 import requests
 import io
-from geoalchemy2.shape import to_shape
+import shapely
+from sqlalchemy import select
 from flask import current_app, request, session
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta, timezone
-import time
 import uuid
 import logging
 import bleach
@@ -20,12 +20,15 @@ import utils
 from utils import csrf_protected
 import geo_ingestion
 import db_actions
+import db_routing
+import queries
+from query_cache import cache
 from models import *
 import minio_routes
 
 from flask_login import current_user
 from flask_login import login_required
-from extensions import db
+from extensions import db, change_feed
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -47,54 +50,47 @@ def register_callbacks(app):
         return pathname
 
 
-    @app.callback(
-        Output('results-title', 'children'),
-        Input('datadict-table', 'data'))
-    def update_results_title(data):
-        return f"Results: {str(len(data))}"
+    # Callbacks which only compute UI state from data already in the
+    # browser run there, see assets/ui.js
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='selectedFiles'),
+        Output('associated-files-selected', 'data'),
+        Input('associated-files-table', 'selected_rows'),
+        State('associated-files-table', 'data'),
+        State('associated-files-selected', 'data'),
+        prevent_initial_call=True)
 
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='downloadTitle'),
         Output('object-info-button', 'children'),
-        Input('associated-files-table', 'selected_rows'),
+        Input('associated-files-selected', 'data'),
         prevent_initial_call=True)
-    def update_download_title(selected):
-        return f"ℹ️ {str(len(selected))}"
 
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='selectionButtons'),
         Output("object-info-button", "disabled"),
         Output("deselect-button", "disabled"),
         Output("delete-button", "disabled"),
         Output("object-info-button", "color"),
         Output("deselect-button", "color"),
         Output("delete-button", "color"),
-        Input('associated-files-table', 'selected_rows'),
+        Input('associated-files-selected', 'data'),
         prevent_initial_call=True
     )
-    def activate_selection_buttons(selected):
-        if selected is None or selected == []:
-            return True, True, True, 'secondary', 'secondary', 'secondary'
-        if len(selected) == 1:
-            return False, False, False, 'primary', 'primary', 'danger'
-        # only allow delete button for one file at a time
-        elif len(selected) > 1:
-            return False, False, True, 'primary', 'primary', 'secondary'
-        return True, True, True, 'secondary', 'secondary', 'secondary'
 
 
     @app.callback(
         Output("delete-modal", 'is_open'),
         Output('delete_datatable', 'children'),
         Input('delete-button', 'n_clicks'),
-        State('associated-files-table', 'selected_rows'),
-        State('associated-files-table', 'data'),
+        State('associated-files-selected', 'data'),
         prevent_initial_call=True,
     )
-    def delete_datatable(n, selected, data):
+    def delete_datatable(n, selected):
         if not selected:
             return no_update, no_update
-        selected = [data[i] for i in selected]
         df = pd.DataFrame(selected)
         df = df.loc[df['owner'] == current_user.email]
         return True, figures.deleteTable(df)
@@ -104,6 +100,7 @@ def register_callbacks(app):
         Output('delete-modal-alert', 'children'),
         Output('delete-modal-alert', 'color'),
         Output('delete-modal-alert', 'is_open'),
+        Output('objects-change', 'data', allow_duplicate=True),
         Input('yes-delete', 'n_clicks'),
         State('delete-table', 'data'),
         State('csrf-store', 'data'),
@@ -121,7 +118,7 @@ def register_callbacks(app):
             logger.info(
                 f"delete_files: owner does not match current user, user: {current_user.email}, owner: {data['owner']}, object: {data['minio_filename']}, bucket: {data['minio_bucket']}"
             )
-            return "You can only delete files belonging to yourself", "danger", True
+            return "You can only delete files belonging to yourself", "danger", True, no_update
 
         bucket = data['minio_bucket']
         object = data['minio_filename']
@@ -137,7 +134,7 @@ def register_callbacks(app):
             logger.error(
                 f"delete_files: user session issue, user: {current_user.email}, exception: {e}"
             )
-            return "User session not found", "danger", True
+            return "User session not found", "danger", True, no_update
 
         try:
             minio_routes.minio_tag(bucket, object, 'delete_scheduled', 'true')
@@ -149,12 +146,13 @@ def register_callbacks(app):
             logger.info(
                 f"delete_files: successful delete, user: {current_user.email}, bucket: {bucket}, object: {minio_filename}"
             )
-            return f"Successfully deleted {data['filename']}", "success", True
+            change = {'action': 'delete', 'uuid': uuid, 'data_dict_uuid': data['data_dict_uuid']}
+            return f"Successfully deleted {data['filename']}", "success", True, change
         except Exception as e:
             logger.error(
                 f"delete_files: exception when trying to delete file, user: {current_user.email}, exception: {e}, bucket: {bucket}, object: {minio_filename}"
             )
-            return f"Error. Please try again later", "danger", True
+            return f"Error. Please try again later", "danger", True, no_update
 
 
     @app.callback(
@@ -173,24 +171,23 @@ def register_callbacks(app):
 
     @app.callback(
         Output('associated-files-table', 'selected_rows'),
+        Output('associated-files-selected', 'data', allow_duplicate=True),
         Input('delete-button', 'n_clicks'),
         Input('download-button', 'n_clicks'),
         prevent_initial_call=True
     )
     def uncheck_table(n1, n2):
-        return []
+        return [], []
 
 
     @app.callback(
         Output('object-info-modal', 'is_open'),
         Output('object-info-record-display', 'children'),
         Input('object-info-button', 'n_clicks'),
-        State('associated-files-table', 'selected_rows'),
-        State('associated-files-table', 'data'),
+        State('associated-files-selected', 'data'),
         prevent_initial_call=True
     )
-    def object_info_modal(n, selected_rows, data):
-        data = [data[i] for i in selected_rows]
+    def object_info_modal(n, data):
         keys_to_keep = {
             'filename', 'uuid', 'model_domain', 'description',
             'filename_extension', 'data_dict_uuid', 'owner', 'gis', 'size',
@@ -207,73 +204,77 @@ def register_callbacks(app):
 
     @app.callback(
         Output('Map', 'figure'),
-        Input('associated-files-table', 'selected_rows'),
-        State('associated-files-table', 'data'),
-        State('Map', 'figure'),
+        Output('map-traces', 'data'),
+        Input('associated-files-selected', 'data'),
+        State('map-traces', 'data'),
         prevent_initial_call=True)
-    def render_map(pg_selected, pg_data, current_figure):
+    def render_map(pg_selected, traces):
         if pg_selected is None or len(pg_selected) == 0:
-            return figures.default_map()
+            return figures.default_map(), None
 
-        selected = [pg_data[i] for i in pg_selected]
-        df = pd.read_sql_table('object_store_metadata', con=db.engine)
-        df = df.loc[df['uuid'].astype(str).isin([d["uuid"] for d in selected])]
-        df['polygon'] = df['spatial_extents'].apply(lambda geom: to_shape(geom) if geom is not None else None)
-        df = df.dropna(subset=['polygon'])
+        selected = {
+            figures.map_trace_name(d['filename'], d['uuid']): d['uuid']
+            for d in pg_selected
+        }
+        kept, removed = utils.update_map_traces(traces or [], selected)
+        on_map = {trace['name'] for trace in kept}
+        new = [uuid.UUID(u) for name, u in selected.items() if name not in on_map]
+
+        added = figures.footprints([], [], [])
+        if new:
+            df = cache.read_sql('render_map', select(
+                Objects.uuid, Objects.filename,
+                queries.footprint('footprint_coarse').label('spatial_extents')
+            ).where(Objects.uuid.in_(new)).where(Objects.spatial_extents.isnot(None)))
+            geometries = utils.from_wkb_elements(df['spatial_extents'])
+            uuids = df['uuid'].astype(str).tolist()
+            names = [figures.map_trace_name(f, u) for f, u in zip(df['filename'], uuids)]
+            added = figures.footprints(names, uuids, geometries)
+            kept.extend(
+                {'name': name, 'bounds': bounds}
+                for name, bounds in zip(names, shapely.bounds(geometries).tolist())
+            )
 
-        if df.empty:
-            return figures.default_map()
+        if not kept:
+            return figures.default_map(), None
 
-        trace_names, current_figure = utils.update_map_traces(df, current_figure)
-        lat, lon, zoom = utils.calculate_map_zoom_and_position(df)
-        return figures.update_map(df, trace_names, current_figure, lat, lon, zoom)
+        lat, lon, zoom = utils.calculate_map_zoom_and_position(
+            [trace['bounds'] for trace in kept]
+        )
+        if traces is None:
+            return figures.new_map(added, lat, lon, zoom), kept
+        return figures.update_map(added, removed, lat, lon, zoom), kept
 
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='estimatedSize'),
         Output("size-estimation", "children"),
-        Input("associated-files-table", "selected_rows"),
-        State("associated-files-table", "data"),
+        Input('associated-files-selected', 'data'),
     )
-    def estimated_download_size(selected_rows, data):
-        data = [data[i] for i in selected_rows]
-        size = sum(item['size'] for item in data)
-        return f"Estimated size: {utils.format_size(size)}"
 
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='downloadButton'),
         Output("download-button", "children"),
         Output("download-button", "disabled"),
         Output("download-button", "color"),
-        Input("associated-files-table", "selected_rows"),
-        State("associated-files-table", "data"),
+        Input('associated-files-selected', 'data'),
         prevent_initial_call=True
     )
-    def download_button_look(selected_rows, data):
-        data = [data[i] for i in selected_rows]
-        if 0 < len(data) <= 10:
-            size = sum(item['size'] for item in data)
-            return f"Download ({utils.format_size(size)})", False, "primary"
-        elif len(data) > 10:
-            return "Download MAXIMUM EXCEEDED (10 Files)", True, "secondary"
-        else:
-            return "Download 0B", True, "secondary"
 
 
     @app.callback(
         Output("download-url", "data"),
         Input('download-button', 'n_clicks'),
-        State("associated-files-table", "selected_rows"),
-        State("associated-files-table", "data"),
+        State('associated-files-selected', 'data'),
         State('csrf-store', 'data'),
         prevent_initial_call=True)
     @login_required
     @csrf_protected
-    def download(n, selected_rows, data, csrf_token):
-        if selected_rows is None:
+    def download(n, data, csrf_token):
+        if data is None:
             return no_update
 
-        data = [data[i] for i in selected_rows]
-
         if len(data) == 1:
             bucket = data[0]['minio_bucket']
             object = data[0]['minio_filename']
@@ -316,17 +317,15 @@ def register_callbacks(app):
     @app.callback(
         Output("log-output", "children"),
         Input("download-button", "n_clicks"),
-        State('associated-files-table', 'selected_rows'),
-        State('associated-files-table', 'data'),
+        State('associated-files-selected', 'data'),
         State('csrf-store', 'data'),
         prevent_initial_call=True)
     @login_required
     @csrf_protected
-    def insert_download_record(n, selected_rows, data, csrf_token):
+    def insert_download_record(n, data, csrf_token):
         logger.debug(
             f"insert_download_record: callback triggered, user: {current_user.email}, trigger: {ctx.triggered_id}"
         )
-        data = [data[i] for i in selected_rows]
         df = pd.DataFrame(data)
         file_uuids = df['uuid'].tolist()
         filenames = df['minio_filename'].tolist()
@@ -339,52 +338,75 @@ def register_callbacks(app):
         return no_update
 
 
-    @app.callback(
-        Output('filter-datadict-model_domain', 'options'),
-        Input('interval_pg', 'n_intervals'))
-    def filter_5(n):
-        df = pd.read_sql_table('model_data_dictionary', con=db.engine)
-        return sorted(list(set(df['model_domain'].dropna())))
+    # Applies change events pushed by the server (see events.py and
+    # assets/events.js): refreshes the files table in place when the
+    # selected catalogue item gains, loses or changes a file, adds new tags
+    # to the tag options and revalidates the catalogue store when the
+    # catalogue or its summary changes
+    app.clientside_callback(
+        """
+        function(event, selected_rows, data, last_change, options) {
+            const no_update = window.dash_clientside.no_update;
+            let change = no_update, tags = no_update, catalogue = no_update;
+            if (event.table === 'object_store_metadata'
+                    && selected_rows && selected_rows.length > 0
+                    && data[selected_rows[0]].uuid === event.data_dict_uuid
+                    // the user's own upload or delete is already applied
+                    && !(last_change && last_change.uuid === event.key)) {
+                change = event;
+            }
+            if (event.table === 'tags' && event.tag
+                    && !(options || []).some(o => o.value === event.tag)) {
+                tags = (options || []).concat([{label: event.tag, value: event.tag}]);
+            }
+            if (event.table === 'model_data_dictionary'
+                    || event.table === 'catalogue_summary') {
+                catalogue = event;
+            }
+            return [change, tags, catalogue];
+        }
+        """,
+        Output('files-event', 'data'),
+        Output('tags-options', 'options', allow_duplicate=True),
+        Output('catalogue-change', 'data'),
+        Input('server-events', 'data'),
+        State('datadict-table', 'selected_rows'),
+        State('datadict-table', 'data'),
+        State('objects-change', 'data'),
+        State('tags-options', 'options'),
+        prevent_initial_call=True
+    )
 
 
+    # The catalogue is kept in the browser, which fills in the filter
+    # options and filters the catalogue table itself
     @app.callback(
-        Output('filter-datadict-filename_extensions', 'options'),
-        Input('interval_pg', 'n_intervals'))
-    def filter_6(n):
-        df = pd.read_sql_table('model_data_dictionary', con=db.engine)
-        return sorted(list(set(item for col in df['filename_extensions'].dropna() for item in col)))
+        Output('catalogue-store', 'data'),
+        Output('catalogue-etag', 'data'),
+        Input('interval_pg', 'n_intervals'),
+        Input('catalogue-change', 'data'),
+        State('catalogue-etag', 'data'),
+        State('csrf-store', 'data'))
+    @login_required
+    @csrf_protected
+    def load_catalogue(n, change, etag, csrf_token):
+        # like a conditional GET: the browser's copy is only replaced when
+        # its ETag no longer matches
+        current, records = queries.catalogue()
+        if etag == current:
+            raise PreventUpdate
+        return {'etag': current, 'records': records}, current
 
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='catalogueOptions'),
+        Output('filter-datadict-model_domain', 'options'),
+        Output('filter-datadict-filename_extensions', 'options'),
         Output('filter-datadict-relation', 'options'),
-        Input('interval_pg', 'n_intervals'))
-    def filter_7(n):
-        df = pd.read_sql_table('model_data_dictionary', con=db.engine)
-        return sorted(list(set(df['relation_type'].dropna())))
-
-
-    @app.callback(
         Output('filter-datadict-produced_by', 'options'),
-        Input('interval_pg', 'n_intervals'))
-    def filter_8(n):
-        df = pd.read_sql_table('model_data_dictionary', con=db.engine)
-        return sorted(list(set(item for col in df['produced_by'].dropna() for item in col)))
-
-
-    @app.callback(
         Output('filter-datadict-ingested_by', 'options'),
-        Input('interval_pg', 'n_intervals'))
-    def filter_9(n):
-        df = pd.read_sql_table('model_data_dictionary', con=db.engine)
-        return sorted(list(set(item for col in df['ingested_by'].dropna() for item in col)))
-
-
-    @app.callback(
         Output('filter-datadict-modified_by', 'options'),
-        Input('interval_pg', 'n_intervals'))
-    def filter_10(n):
-        df = pd.read_sql_table('model_data_dictionary', con=db.engine)
-        return sorted(list(set(item for col in df['modified_by'].dropna() for item in col)))
+        Input('catalogue-store', 'data'))
 
 
     @app.callback(
@@ -397,62 +419,33 @@ def register_callbacks(app):
         Output('filter-datadict-ingested_by', 'value'),
         Output('filter-datadict-modified_by', 'value'),
         Output('filter-datadict-gis', 'value'),
-        Output('datadict-table', 'selected_rows'),
         Output('datadict-apply-filters', 'n_clicks'),
         Input('datadict-remove-filters', 'n_clicks'),
         prevent_initial_call=True)
     def remove_datadict_filters(n):
-        return "", "", [], [], [], [], [], [], [], [], 0
+        return "", "", [], [], [], [], [], [], None, 0
 
 
-    @app.callback(
-        Output('data_dict_datatable', 'children'),
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='filterCatalogue'),
+        Output('datadict-table', 'data'),
+        Output('datadict-table', 'tooltip_data'),
+        Output('datadict-table', 'selected_rows'),
+        Output('results-title', 'children'),
+        Input('catalogue-store', 'data'),
         Input('datadict-apply-filters', 'n_clicks'),
-        State('filter-datadict-name', 'value'),
-        State('filter-datadict-uuid', 'value'),
-        State('filter-datadict-model_domain', 'value'),
-        State('filter-datadict-filename_extensions', 'value'),
-        State('filter-datadict-relation', 'value'),
-        State('filter-datadict-produced_by', 'value'),
-        State('filter-datadict-ingested_by', 'value'),
-        State('filter-datadict-modified_by', 'value'),
-        State('filter-datadict-gis', 'value'),
-        State('csrf-store', 'data'),
-    )
-    @login_required
-    @csrf_protected
-    def populate_datadict_datatable(n, name_val, uuid_val, model_domain_val, filename_extensions_val, relation_val, produced_by_val, ingested_by_val, modified_by_val, gis_val, csrf_token):
-        name_val = bleach.clean(name_val) if name_val else None
-        uuid_val = bleach.clean(uuid_val) if uuid_val else None
-
-        df = pd.read_sql_table('model_data_dictionary', con=db.engine)
-        df = df[df['filename_extensions'].notna()]
-        df = df[df['mime_types'].notna()]
-
-        if name_val is not None:
-            df = df[df['name'].str.contains(name_val, case=False, na=False)]
-        if uuid_val is not None:
-            df = df[df['uuid'].astype(str).str.contains(uuid_val, case=False, na=False)]
-        if len(model_domain_val) > 0:
-            df = df.loc[df['model_domain'].isin(model_domain_val)]
-        if len(filename_extensions_val) > 0:
-            df = utils.filter_df_list(df, 'filename_extensions', filename_extensions_val)
-        if len(relation_val) > 0:
-            df = df.loc[df['relation_type'].isin(relation_val)]
-        if len(produced_by_val) > 0:
-            df = utils.filter_df_list(df, 'produced_by', produced_by_val)
-        if len(ingested_by_val) > 0:
-            df = utils.filter_df_list(df, 'ingested_by', ingested_by_val)
-        if len(modified_by_val) > 0:
-            df = utils.filter_df_list(df, 'modified_by', modified_by_val)
-        if gis_val:
-            if gis_val == 'true':
-                bool_val = True
-            elif gis_val == 'false':
-                bool_val = False
-            df = df.loc[df['gis'] == bool_val]
-
-        return figures.dataDictTable(df)
+        Input('filter-datadict-name', 'value'),
+        Input('filter-datadict-uuid', 'value'),
+        Input('filter-datadict-model_domain', 'value'),
+        Input('filter-datadict-filename_extensions', 'value'),
+        Input('filter-datadict-relation', 'value'),
+        Input('filter-datadict-produced_by', 'value'),
+        Input('filter-datadict-ingested_by', 'value'),
+        Input('filter-datadict-modified_by', 'value'),
+        Input('filter-datadict-gis', 'value'),
+        State('datadict-table', 'hidden_columns'),
+        State('datadict-table', 'selected_rows'),
+        State('datadict-table', 'data'))
 
 
     @app.callback(
@@ -476,33 +469,224 @@ def register_callbacks(app):
 
 
     @app.callback(
-        Output('associated-files-title', 'children'),
         Output('associated-files-table-location', 'children'),
-        Input('yes-delete', 'n_clicks'),
-        Input('upload-alert', 'is_open'),
+        Output('associated-files-state', 'data'),
+        Output('associated-files-selected', 'data', allow_duplicate=True),
+        Input('objects-change', 'data'),
         Input('datadict-table', 'selected_rows'),
         Input('deselect-button', 'n_clicks'),
         State('datadict-table', 'data'),
         prevent_initial_call=True)
-    def associatedFilesTable(n_delete, upload_alert, selected_rows, deselect, data):
-        if 'yes-delete' == ctx.triggered_id or 'upload-alert' == ctx.triggered_id:
-            # wait a moment for db to update before refreshing
-            time.sleep(3)
+    def associatedFilesTable(change, selected_rows, deselect, data):
+        # uploads and deletes are committed, and the user's reads pinned to
+        # the primary, before objects-change is set, so no wait is needed
         selected = []
         if selected_rows is None or selected_rows == []:
-            return 'Associated Files: 0', []
+            return [], None, []
         data = data[selected_rows[0]]
-        uuid = UUID(data['uuid'])
-        q = (
-            db.session.query(Objects)
-            .filter(Objects.data_dict_uuid == uuid)
-            .filter(Objects.status == 'active')
+        q = queries.objects_query(data['uuid'])
+        total = queries.count(q, site='files_count')
+        df, state = queries.page(
+            q, queries.OBJECTS_SORTABLE, 'filename', [], 0,
+            figures.FILES_PAGE_SIZE, site='files_page'
+        )
+        state.update(data_dict_uuid=data['uuid'], total=total)
+        page_count = queries.page_count(total, figures.FILES_PAGE_SIZE)
+        return figures.associatedFilesTable(df, selected, page_count), state, []
+
+
+    @app.callback(
+        Output('associated-files-table', 'data'),
+        Output('associated-files-table', 'tooltip_data'),
+        Output('associated-files-table', 'page_count'),
+        Output('associated-files-table', 'page_current'),
+        Output('associated-files-table', 'selected_rows', allow_duplicate=True),
+        Output('associated-files-state', 'data', allow_duplicate=True),
+        Input('associated-files-table', 'page_current'),
+        Input('associated-files-table', 'sort_by'),
+        Input('associated-files-table', 'filter_query'),
+        State('associated-files-state', 'data'),
+        State('associated-files-selected', 'data'),
+        prevent_initial_call=True)
+    @login_required
+    def page_associated_files(page_current, sort_by, filter_query, state, selected):
+        if state is None:
+            raise PreventUpdate
+        q = queries.objects_query(state['data_dict_uuid'], filter_query)
+        if filter_query != state.get('filter_query', ''):
+            # a new filter changes the total and starts again from page one,
+            # and the keys of the old result set are no place to seek from
+            state.update(filter_query=filter_query, total=queries.count(q, site='files_count'))
+            state.update(page=None, first=None, last=None)
+            page_current = 0
+        df, page_state = queries.page(
+            q, queries.OBJECTS_SORTABLE, 'filename', sort_by,
+            page_current, figures.FILES_PAGE_SIZE, state, site='files_page'
+        )
+        state.update(page_state)
+        data, tooltip_data = figures.table_records(df, figures.FILES_HIDDEN_COLUMNS)
+        page_count = queries.page_count(state['total'], figures.FILES_PAGE_SIZE)
+        selected_rows = utils.selected_rows(data, selected)
+        return data, tooltip_data, page_count, page_current, selected_rows, state
+
+
+    @app.callback(
+        Output('associated-files-table', 'data', allow_duplicate=True),
+        Output('associated-files-table', 'tooltip_data', allow_duplicate=True),
+        Output('associated-files-table', 'page_count', allow_duplicate=True),
+        Output('associated-files-table', 'page_current', allow_duplicate=True),
+        Output('associated-files-table', 'selected_rows', allow_duplicate=True),
+        Output('associated-files-state', 'data', allow_duplicate=True),
+        Input('files-event', 'data'),
+        State('associated-files-table', 'page_current'),
+        State('associated-files-table', 'sort_by'),
+        State('associated-files-table', 'data'),
+        State('associated-files-state', 'data'),
+        State('associated-files-selected', 'data'),
+        prevent_initial_call=True)
+    @login_required
+    def refresh_associated_files(event, page_current, sort_by, data, state, selected):
+        # another user's change to the selected catalogue item's files. The
+        # page being viewed is read again from its first row, and only
+        # replaced if it has changed, keeping the page and selected files
+        if state is None or event.get('data_dict_uuid') != state['data_dict_uuid']:
+            raise PreventUpdate
+        q = queries.objects_query(state['data_dict_uuid'], state.get('filter_query', ''))
+        total = queries.count(q, site='files_count')
+        page_count = queries.page_count(total, figures.FILES_PAGE_SIZE)
+        if (page_current or 0) >= page_count:
+            # the last page has gone, so move back to the new last page,
+            # which page_associated_files reads
+            return no_update, no_update, page_count, page_count - 1, no_update, {**state, 'total': total}
+
+        df, page_state = queries.page(
+            q, queries.OBJECTS_SORTABLE, 'filename', sort_by,
+            page_current, figures.FILES_PAGE_SIZE, state, site='files_page'
         )
-        df = pd.read_sql_query(
-            sql=q.statement,
-            con=db.engine
+        new_state = {**state, **page_state, 'total': total}
+        new_data, tooltip_data = figures.table_records(df, figures.FILES_HIDDEN_COLUMNS)
+        if new_data == data:
+            if new_state == state:
+                raise PreventUpdate
+            return no_update, no_update, page_count, no_update, no_update, new_state
+
+        selected_rows = utils.selected_rows(new_data, selected)
+        return new_data, tooltip_data, page_count, no_update, selected_rows, new_state
+
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='filesTitle'),
+        Output('associated-files-title', 'children'),
+        Input('associated-files-state', 'data'))
+
+
+    @app.callback(
+        Output('spatial-search-modal', 'is_open'),
+        Output('spatial-search-map', 'figure'),
+        Input('spatial-search-button', 'n_clicks'),
+        prevent_initial_call=True)
+    def open_spatial_search(n):
+        return True, figures.spatial_search_map()
+
+
+    @app.callback(
+        Output('spatial-search-table-location', 'children'),
+        Output('spatial-search-state', 'data'),
+        Output('spatial-search-alert', 'children'),
+        Output('spatial-search-alert', 'is_open'),
+        Input('spatial-search-map', 'selectedData'),
+        Input('spatial-search-submit', 'n_clicks'),
+        State('spatial-search-bbox', 'value'),
+        prevent_initial_call=True)
+    @login_required
+    def spatial_search(selected_data, n, bbox):
+        try:
+            if 'spatial-search-submit' == ctx.triggered_id:
+                geometry = utils.parse_bbox(bleach.clean(bbox or ''))
+            else:
+                geometry = utils.selection_geometry(selected_data)
+        except ValueError as e:
+            return no_update, no_update, str(e), True
+        if geometry is None:
+            return [], None, no_update, False
+
+        q = queries.spatial_search_query(geometry.wkt)
+        total = queries.count(q, site='spatial_search_count')
+        df = queries.offset_page(q, 0, figures.FILES_PAGE_SIZE, site='spatial_search_page')
+        logger.debug(
+            f"spatial_search: user: {current_user.email}, bounds: {geometry.bounds}, results: {total}"
         )
-        return f'Associated Files: {len(df)}', figures.associatedFilesTable(df, selected)
+        state = {'wkt': geometry.wkt, 'total': total}
+        page_count = queries.page_count(total, figures.FILES_PAGE_SIZE)
+        return figures.spatialSearchTable(df, page_count), state, no_update, False
+
+
+    @app.callback(
+        Output('spatial-search-table', 'data'),
+        Output('spatial-search-table', 'tooltip_data'),
+        Input('spatial-search-table', 'page_current'),
+        State('spatial-search-state', 'data'),
+        prevent_initial_call=True)
+    @login_required
+    def page_spatial_search(page_current, state):
+        if state is None:
+            raise PreventUpdate
+        df = queries.offset_page(
+            queries.spatial_search_query(state['wkt']), page_current,
+            figures.FILES_PAGE_SIZE, site='spatial_search_page'
+        )
+        return figures.table_records(df, figures.SEARCH_HIDDEN_COLUMNS)
+
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='spatialSearchTitle'),
+        Output('spatial-search-title', 'children'),
+        Input('spatial-search-state', 'data'))
+
+
+    @app.callback(
+        Output('text-search-modal', 'is_open'),
+        Output('text-search-table-location', 'children'),
+        Output('text-search-state', 'data'),
+        Input('text-search-submit', 'n_clicks'),
+        Input('text-search-input', 'n_submit'),
+        State('text-search-input', 'value'),
+        prevent_initial_call=True)
+    @login_required
+    def text_search(n_clicks, n_submit, text):
+        tsquery = queries.prefix_tsquery(bleach.clean(text)) if text else None
+        if tsquery is None:
+            return no_update, no_update, no_update
+        total = queries.count(queries.text_search_query(tsquery), site='text_search_count')
+        df = queries.text_search(tsquery, 0, figures.FILES_PAGE_SIZE)
+        logger.debug(
+            f"text_search: user: {current_user.email}, query: {tsquery}, results: {total}"
+        )
+        page_count = queries.page_count(total, figures.FILES_PAGE_SIZE)
+        state = {'tsquery': tsquery, 'total': total}
+        return True, figures.textSearchTable(df, page_count), state
+
+
+    @app.callback(
+        Output('text-search-table', 'data'),
+        Input('text-search-table', 'page_current'),
+        State('text-search-state', 'data'),
+        prevent_initial_call=True)
+    @login_required
+    def page_text_search(page_current, state):
+        if state is None:
+            raise PreventUpdate
+        df = queries.text_search(
+            state['tsquery'], page_current, figures.FILES_PAGE_SIZE
+        )
+        data, _ = utils.serialize_frame(df)
+        return data
+
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='textSearchTitle'),
+        Output('text-search-title', 'children'),
+        Input('text-search-state', 'data'))
 
 
     @app.callback(
@@ -516,7 +700,7 @@ def register_callbacks(app):
     )
     def submit_tag(n_clicks, n_intervals, value, tag_text):
         tag_text = bleach.clean(tag_text) if tag_text else None
-        df = pd.read_sql_table('tags', con=db.engine)
+        df = cache.read_table('submit_tag', 'tags')
         tags = df['tag'].tolist()
         options = []
         for tag in tags:
@@ -538,31 +722,20 @@ def register_callbacks(app):
         return options, value, ""
 
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='uploadName'),
         Output('upload-data', 'children'),
         Input('upload-data', 'filename'),
         prevent_initial_call=True)
-    def upload_name_contents(filename):
-        if filename is not None:
-            return f"Selected: {filename}"
-        return html.Div([
-            'Drag and Drop or ',
-            html.A('Select Files')
-        ])
 
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='uploadButton'),
         Output("upload-button", "disabled"),
         Output('upload-button', 'color'),
         Input('upload-data', 'filename'),
         Input('datadict-table', 'selected_rows'),
         prevent_initial_call=True)
-    def enable_upload_button(filename, selected_rows):
-        if selected_rows is None:
-            return True, 'secondary'
-        if filename is not None and len(selected_rows) > 0:
-            return False, 'primary'
-        return True, 'secondary'
 
 
     @app.callback(
@@ -586,6 +759,7 @@ def register_callbacks(app):
         Output('upload-alert', 'icon'),
         Output('upload-alert', 'is_open'),
         Output("loading-target-output", "children"),
+        Output('objects-change', 'data', allow_duplicate=True),
         Input("upload-button", "n_clicks"),
         State('upload-data', 'contents'),
         State('upload-data', 'filename'),
@@ -612,13 +786,13 @@ def register_callbacks(app):
                 f"handle_upload: user session issue, user: {current_user.email}"
                 f", exception: {e}"
             )
-            return f"Upload of '{filename}' failed: User session not found", "danger", True, None
+            return f"Upload of '{filename}' failed: User session not found", "danger", True, None, no_update
 
         if contents is None:
             logger.debug(
                 f"handle_upload: no file in upload, user: {current_user.email}"
             )
-            return "No file uploaded yet.", "warning", False, None
+            return "No file uploaded yet.", "warning", False, None, no_update
 
         filename = bleach.clean(filename) if filename else None
         filename = secure_filename(filename)
@@ -627,6 +801,8 @@ def register_callbacks(app):
         user = current_user.email
         tags = selected_tags if len(selected_tags) != 0 else None
         extents = None
+        footprints = {}
+        layers = []
         spatial_property = False
         geo_failed = False
         clamav_scan = "succeeded"
@@ -647,30 +823,34 @@ def register_callbacks(app):
             logger.info(f"security checks passed, user: {current_user.email}")
         except Exception as e:
             logger.info(f"security check exception: {str(e)}")
-            return f"Upload of '{filename}' failed: {str(e)}", "danger", True, None
+            return f"Upload of '{filename}' failed: {str(e)}", "danger", True, None, no_update
 
         # todo: fix errors and add to other security checks try block above
         try:
             if c := utils.clamav_scanner(io_decoded):
-                return c, "danger", True, None
+                return c, "danger", True, None, no_update
         except Exception as e:
             logger.error(
                 f"upload_file: ClamAV exception, exception: {str(e)}"
             )
             clamav_scan = f"exception: {str(e)}"
 
-        if data['gis'] is True and dict_extension != 'asc':
+        if data['gis'] is True:
             try:
-                extents = geo_ingestion.main(filename, decoded)
+                extents, footprints, layers = geo_ingestion.main(
+                    filename, decoded,
+                    raster_crs=current_app.config['RASTER_SOURCE_CRS']
+                )
                 spatial_property = True
+            except utils.ArchiveRejected as e:
+                logger.info(f"security check exception: {str(e)}")
+                return f"Upload of '{filename}' failed: {str(e)}", "danger", True, None, no_update
             except Exception as e:
                 logger.warning(
                     f"handle_upload: spatial extraction exception, user: {current_user.email}, exception: {e}, decoded length: {length}, catalogue UUID: {data['uuid']}"
                 )
                 geo_error = e
                 geo_failed = True
-                if str(e) == "Extension not allowed":
-                    return f"Upload of '{filename}' failed: .zip contains a file which is not allowed", "danger", True, None
 
         try:
             minio_routes.upload_file(minio_filename, io_decoded, detected_mime)
@@ -682,7 +862,7 @@ def register_callbacks(app):
                 f"upload_file exception, bucket={MODELS_BUCKET}, "
                 f"object={filename}, exception={e}"
             )
-            return f"Upload of '{filename}' failed: Upload to database error", "danger", True, None
+            return f"Upload of '{filename}' failed: Upload to database error", "danger", True, None, no_update
 
         try:
             minio_routes.check_file_exists(MODELS_BUCKET, minio_filename)
@@ -695,7 +875,7 @@ def register_callbacks(app):
                 f"check_file_exists exception, bucket: {MODELS_BUCKET}, "
                 f"object: {filename}, exception: {e}"
             )
-            return f"Upload of '{filename}' failed: File not confirmed in database", "danger", True, None
+            return f"Upload of '{filename}' failed: File not confirmed in database", "danger", True, None, no_update
 
         db.session.add(Objects(
             uuid=unique_id,
@@ -707,6 +887,7 @@ def register_callbacks(app):
             owner=user,
             gis=spatial_property,
             spatial_extents=extents,
+            **footprints,
             size=length,
             tags=tags,
             minio_filename=minio_filename,
@@ -714,17 +895,24 @@ def register_callbacks(app):
             status="active",
             clamav_scan=clamav_scan
         ))
+        db.session.add_all(Layers(object_uuid=unique_id, **layer) for layer in layers)
         db.session.commit()
+        db_routing.mark_write()
+        change_feed.bump(Objects.__tablename__)
+        db_actions.refresh_catalogue_summary()
         db_actions.record_pg_uploads(user, minio_filename, length)
 
         logger.info(
             f"handle_upload: upload successful, user: {current_user.email}, bucket: {MODELS_BUCKET}, object: {minio_filename}, decoded length: {length}, catalogue UUID: {data['uuid']}"
         )
 
+        # passed to associatedFilesTable, which reads the new row straight away
+        change = {'action': 'upload', 'uuid': str(unique_id), 'data_dict_uuid': data['uuid']}
+
         if geo_failed is True:
-            return f"Upload of '{filename}' successful, but failed to extract spatial extents: {geo_error}", "warning", True, None
+            return f"Upload of '{filename}' successful, but failed to extract spatial extents: {geo_error}", "warning", True, None, change
 
-        return f"Upload of '{filename}' successful", "success", True, None
+        return f"Upload of '{filename}' successful", "success", True, None, change
 
 
     @app.callback(
@@ -760,10 +948,9 @@ def register_callbacks(app):
         return extension
 
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='ui', function_name='showHelp'),
         Output('help-modal', 'is_open'),
         Input('help-button', 'n_clicks'),
         prevent_initial_call=True
-    )
-    def show_help(n):
-        return True
\ No newline at end of file
+    )
\ No newline at end of file
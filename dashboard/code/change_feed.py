@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import select
+import logging
+import threading
+from collections import defaultdict
+import psycopg2
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'table_changes'
+
+# Tables whose triggers publish to CHANNEL, and the columns of each sent in
+# the payload. Payloads are {"table": ..., "op": INSERT|UPDATE|DELETE, "key":
+# uuid or id} plus the catalogue uuid, status and tag of the row where it
+# has them, which lets browsers decide whether a change affects what they
+# are showing
+PAYLOADS = {
+    'object_store_metadata': {'key': 'uuid', 'data_dict_uuid': 'data_dict_uuid', 'status': 'status'},
+    'model_data_dictionary': {'key': 'uuid'},
+    'tags': {'key': 'id', 'tag': 'tag'},
+    'users': {'key': 'id'},
+}
+TABLES = list(PAYLOADS)
+
+
+def _notify(table, row):
+    # only the named columns of the row are read, rather than the whole row
+    # being serialised, as object_store_metadata carries footprints
+    fields = ', '.join(
+        f"'{field}', {row}.{column}::text" for field, column in PAYLOADS[table].items()
+    )
+    return f"""PERFORM pg_notify('{CHANNEL}', json_build_object(
+                'table', TG_TABLE_NAME, 'op', TG_OP, {fields}
+            )::text);"""
+
+
+DDL = [
+    statement for table in TABLES for statement in (
+        f"""
+        CREATE OR REPLACE FUNCTION notify_{table}_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                {_notify(table, 'OLD')}
+            ELSE
+                {_notify(table, 'NEW')}
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS {table}_notify ON {table}",
+        f"""
+        CREATE TRIGGER {table}_notify
+        AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION notify_{table}_change()
+        """,
+    )
+] + [
+    # the function all tables shared, which serialised the whole row
+    "DROP FUNCTION IF EXISTS notify_table_change()",
+]
+
+
+class ChangeFeed:
+    """Listens for table change notifications in a background thread and
+    keeps a version counter per table for this worker.
+
+    Caches store the version they were filled at and treat an entry as stale
+    once version() has moved on. The generation is bumped on every
+    (re)connect, since notifications sent while disconnected are lost.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._versions = defaultdict(int)
+        # time.time() of each table's last change seen, and of the last
+        # (re)connect, before which any table may have changed unseen
+        self._changed = {}
+        self._connected_at = 0
+        self._subscribers = []
+        self._thread = None
+        self._pid = None
+        self.generation = 0
+        self.connected = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.uri = app.config['CHANGE_FEED_DATABASE_URI']
+        self.enabled = app.config['CHANGE_FEED_ENABLED']
+
+    def start(self):
+        """Start listening in this worker, if not already. The feed is only
+        connected some time after."""
+        self._ensure_started()
+
+    def version(self, table):
+        self._ensure_started()
+        return self.generation, self._versions[table]
+
+    def changed_at(self, tables):
+        """time.time() by which every change to tables seen by this worker
+        had been committed."""
+        with self._lock:
+            return max([self._connected_at] + [self._changed.get(t, 0) for t in tables])
+
+    def bump(self, table):
+        """Mark a table as changed in this worker, as a notification for the
+        write would. Used by writers so their own worker is never stale
+        while the notification is in flight."""
+        with self._lock:
+            self._versions[table] += 1
+            self._changed[table] = time.time()
+
+    def publish(self, conn, event):
+        """Send an event to every worker's subscribers through the database,
+        e.g. progress of a background job. conn is a SQLAlchemy connection;
+        the event is delivered when its transaction commits."""
+        conn.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {'channel': CHANNEL, 'payload': json.dumps(event)}
+        )
+
+    def _dispatch(self, event):
+        with self._lock:
+            if event.get('table'):
+                self._versions[event['table']] += 1
+                # notifications are sent on commit, so this is after it
+                self._changed[event['table']] = time.time()
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"change feed: subscriber exception, exception: {e}")
+
+    def subscribe(self, callback):
+        """Call callback(event) for every change seen by this worker."""
+        self._ensure_started()
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def _ensure_started(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='change-feed', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                logger.warning(f"change feed: connection lost, exception: {e}")
+            if self.connected:
+                backoff = 1
+            self.connected = False
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def _listen(self):
+        conn = psycopg2.connect(self.uri)
+        try:
+            conn.set_session(autocommit=True)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            with self._lock:
+                self.generation += 1
+                self._connected_at = time.time()
+            self.connected = True
+            logger.info(f"change feed: listening, pid: {os.getpid()}")
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    # idle, check the connection is still alive
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        event = json.loads(notify.payload)
+                    except ValueError:
+                        continue
+                    self._dispatch(event)
+        finally:
+            conn.close()
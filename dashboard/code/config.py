@@ -7,10 +7,83 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.getenv('SESSION')
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=20)
+    # the session cookie is only re-signed when the session changes, and
+    # the last activity time only changes once per interval, so the
+    # inactivity timeout is accurate to within this interval
+    SESSION_REFRESH_EACH_REQUEST = False
+    SESSION_ACTIVITY_INTERVAL = timedelta(seconds=int(os.getenv('SESSION_ACTIVITY_INTERVAL', 60)))
+
+    # loaded users are cached per worker, see auth.load_user
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 1000))
 
     SQLALCHEMY_DATABASE_URI = f"postgresql://{os.getenv('PG_USER')}:{os.getenv('PG_PASS')}@{os.getenv('PG_HOST')}:{os.getenv('PG_PORT')}/{os.getenv('PG_NAME')}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # LISTEN needs a direct session, so point this past PgBouncer when
+    # DB_PGBOUNCER is set
+    CHANGE_FEED_ENABLED = os.getenv('CHANGE_FEED_ENABLED', 'true') == 'true'
+    CHANGE_FEED_DATABASE_URI = os.getenv('CHANGE_FEED_DATABASE_URI', SQLALCHEMY_DATABASE_URI)
+
+    # read query results are cached per worker, and in a shared backend
+    # when QUERY_CACHE_BACKEND is a Redis URL ('memory' is an in-process
+    # stand-in). Invalidation relies on the change feed, see query_cache.py
+    QUERY_CACHE_ENABLED = os.getenv('QUERY_CACHE_ENABLED', str(CHANGE_FEED_ENABLED).lower()) == 'true'
+    QUERY_CACHE_BACKEND = os.getenv('QUERY_CACHE_BACKEND', '')
+    QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 256))  # entries
+    QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', 300))  # seconds
+    # how long a miss waits for the same query running elsewhere
+    QUERY_CACHE_WAIT = float(os.getenv('QUERY_CACHE_WAIT', 30))  # seconds
+
+    # EPSG code of rasters which do not give their CRS, which ESRI ASCII
+    # grids never do, see geo_ingestion.raster
+    RASTER_SOURCE_CRS = int(os.getenv('RASTER_SOURCE_CRS', 27700))
+
+    # worker processes for extent extraction, see geo_pool.py
+    GEO_POOL_ENABLED = os.getenv('GEO_POOL_ENABLED', 'true') == 'true'
+    GEO_POOL_SIZE = int(os.getenv('GEO_POOL_SIZE', 2))
+    # tasks a process runs before it is replaced
+    GEO_POOL_MAX_TASKS = int(os.getenv('GEO_POOL_MAX_TASKS', 20))
+    GEO_POOL_TIMEOUT = float(os.getenv('GEO_POOL_TIMEOUT', 300))  # seconds
+
+    # vector tiles of object footprints, see tiles.py. Cached like query
+    # results, in a cache of their own so tiles do not evict other results.
+    # Shares a Redis backend with the query cache, but not the in-process
+    # stand-in, which would only hold a second copy of each worker's tiles
+    TILE_CACHE_ENABLED = os.getenv('TILE_CACHE_ENABLED', str(QUERY_CACHE_ENABLED).lower()) == 'true'
+    TILE_CACHE_BACKEND = os.getenv(
+        'TILE_CACHE_BACKEND', '' if QUERY_CACHE_BACKEND == 'memory' else QUERY_CACHE_BACKEND
+    )
+    TILE_CACHE_SIZE = int(os.getenv('TILE_CACHE_SIZE', 4096))  # tiles
+    TILE_CACHE_TTL = float(os.getenv('TILE_CACHE_TTL', 3600))  # seconds
+    TILE_CACHE_WAIT = QUERY_CACHE_WAIT
+
+    # server-sent events, see events.py
+    EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 15))
+    EVENTS_MAX_DURATION = float(os.getenv('EVENTS_MAX_DURATION', 300))
+
+    # read-only queries are routed to these replicas (comma separated
+    # host:port, same database and credentials as the primary)
+    SQLALCHEMY_BINDS = {
+        f"replica_{i}": f"postgresql://{os.getenv('PG_USER')}:{os.getenv('PG_PASS')}@{host.strip()}/{os.getenv('PG_NAME')}"
+        for i, host in enumerate(h for h in os.getenv('PG_REPLICA_HOSTS', '').split(',') if h.strip())
+    }
+    DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 10))  # seconds
+    DB_REPLICA_LAG_CHECK = float(os.getenv('DB_REPLICA_LAG_CHECK', 5))  # seconds
+    # after writing, a user reads from the primary for at least this long
+    DB_REPLICA_STICKY = float(os.getenv('DB_REPLICA_STICKY', 2))  # seconds
+
+    # connection pool, per gunicorn worker. With DB_PGBOUNCER=true the app
+    # connects through PgBouncer in transaction mode and does not pool itself
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true') == 'true'
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))  # ms
+    DB_APPLICATION_NAME = os.getenv('DB_APPLICATION_NAME', 'dare-data-store')
+    DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false') == 'true'
+
     logging.basicConfig(
         filename='logs/all.log', encoding='utf-8', level=logging.DEBUG,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -22,4 +95,12 @@ class Config:
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
 
-    MAX_CONTENT_LENGTH = int(os.getenv('MAX_UPLOAD_SIZE'))
\ No newline at end of file
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_UPLOAD_SIZE'))
+
+    # writes within this many seconds share one catalogue_summary refresh
+    CATALOGUE_SUMMARY_REFRESH_DELAY = float(os.getenv('CATALOGUE_SUMMARY_REFRESH_DELAY', 5))
+
+    # audit records are flushed when either threshold is reached
+    AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 100))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 2))
+    AUDIT_SPILL_DIR = os.getenv('AUDIT_SPILL_DIR', 'logs/audit')
\ No newline at end of file
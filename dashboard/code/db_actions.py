@@ -1,55 +1,58 @@
 from models import *
-from extensions import db
+from extensions import db, audit_writer, change_feed
 import logging
+import threading
+from sqlalchemy import text
 from flask import current_app
 from datetime import datetime, timedelta
 from itsdangerous import URLSafeTimedSerializer
 
+import db_routing
+
 logger = logging.getLogger(__name__)
 
+_summary_refresh = None
+_summary_lock = threading.Lock()
+
 def record_pg_logins(action, email):
     logger.debug(f"record_pg_logins, user: {email}, action: {action}")
-    record = Logins(
+    audit_writer.record(
+        Logins.__tablename__,
         email=email,
         action=action
     )
-    db.session.add(record)
-    db.session.commit()
 
 
 def record_pg_downloads(email, file_uuids, file_count, filenames):
     logger.debug(f"record_pg_downloads, user: {email}")
-    record = Downloads(
+    audit_writer.record(
+        Downloads.__tablename__,
         email=email,
         file_uuids=file_uuids,
         file_count=file_count,
         minio_filenames=filenames
     )
-    db.session.add(record)
-    db.session.commit()
 
 
 def record_pg_uploads(email, filename, size):
     logger.debug(f"record_pg_uploads, user: {email}, filename: {filename}")
-    record = Uploads(
+    audit_writer.record(
+        Uploads.__tablename__,
         email=email,
         minio_filename=filename,
         size=size
     )
-    db.session.add(record)
-    db.session.commit()
 
 
 def record_pg_deletes(email, file_uuids, time, filename):
     logger.debug(f"record_pg_deletes, user: {email}, filename: {filename}, file UUIDs: {file_uuids}")
-    record = TaggedDeletes(
+    audit_writer.record(
+        TaggedDeletes.__tablename__,
         email=email,
         file_uuids=file_uuids,
         deletion_time=time,
         minio_filename=filename
     )
-    db.session.add(record)
-    db.session.commit()
 
 
 def update_object_status(file_uuid, status, time):
@@ -59,6 +62,41 @@ def update_object_status(file_uuid, status, time):
         item.status = status
         item.deletion_time = time
         db.session.commit()
+        db_routing.mark_write()
+        change_feed.bump(Objects.__tablename__)
+        refresh_catalogue_summary()
+
+
+def refresh_catalogue_summary():
+    """Schedule a refresh of the catalogue_summary view in the background.
+    Writes made before the refresh starts share it."""
+    global _summary_refresh
+    app = current_app._get_current_object()
+    with _summary_lock:
+        if _summary_refresh is not None:
+            return
+        _summary_refresh = threading.Timer(
+            app.config['CATALOGUE_SUMMARY_REFRESH_DELAY'],
+            _refresh_catalogue_summary, args=(app,)
+        )
+        _summary_refresh.daemon = True
+        _summary_refresh.start()
+
+
+def _refresh_catalogue_summary(app):
+    global _summary_refresh
+    with _summary_lock:
+        # writes from here on need another refresh
+        _summary_refresh = None
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY catalogue_summary"))
+                # views have no triggers, so tell every worker's caches
+                change_feed.publish(conn, {'table': 'catalogue_summary', 'op': 'REFRESH'})
+            logger.debug("refresh_catalogue_summary: refreshed")
+        except Exception as e:
+            logger.error(f"refresh_catalogue_summary: exception: {e}")
 
 
 def add_tag(email, tag):
@@ -69,6 +107,8 @@ def add_tag(email, tag):
     )
     db.session.add(record)
     db.session.commit()
+    db_routing.mark_write()
+    change_feed.bump(Tags.__tablename__)
 
 
 def generate_one_time_token(purpose: str, files, max_age: int = 300):
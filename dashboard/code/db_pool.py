@@ -0,0 +1,173 @@
+import os
+import time
+import logging
+import threading
+from flask import Blueprint, jsonify
+from flask_login import login_required
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool, NullPool
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+db_pool_bp = Blueprint('db_pool', __name__)
+
+# checkouts which wait longer than this are logged, as they mean the pool is
+# exhausted and requests are queueing for a connection
+SLOW_CHECKOUT = 1.0
+
+
+class PoolStats:
+    """Per-worker connection pool counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.checkouts = 0
+        self.checkout_time = 0.0
+        self.checkout_max = 0.0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.checkout_errors = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+
+    def _check_fork(self):
+        # counters inherited from a preloading master belong to that process
+        if self.pid != os.getpid():
+            self.reset()
+
+    def checkout(self, elapsed):
+        with self._lock:
+            self._check_fork()
+            self.checkouts += 1
+            self.checkout_time += elapsed
+            self.checkout_max = max(self.checkout_max, elapsed)
+            if elapsed > SLOW_CHECKOUT:
+                self.slow_checkouts += 1
+
+    def incr(self, name):
+        with self._lock:
+            self._check_fork()
+            setattr(self, name, getattr(self, name) + 1)
+
+
+stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool which times how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            stats.incr('timeouts')
+            raise
+        except Exception:
+            # a new connection could not be made, as opposed to the pool
+            # having none free within pool_timeout
+            stats.incr('checkout_errors')
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.checkout(elapsed)
+            if elapsed > SLOW_CHECKOUT:
+                logger.warning(
+                    f"db pool: slow checkout, pid: {os.getpid()}, wait: {elapsed:.3f}s, {self.status()}"
+                )
+
+
+def engine_options(config):
+    application_name = config['DB_APPLICATION_NAME']
+    statement_timeout = config['DB_STATEMENT_TIMEOUT']
+
+    if config['DB_PGBOUNCER']:
+        # PgBouncer in transaction mode does the pooling and rejects the
+        # 'options' startup parameter, so statement_timeout is set per
+        # transaction in instrument()
+        return {
+            'poolclass': NullPool,
+            'connect_args': {'application_name': application_name},
+        }
+
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'connect_args': {
+            'application_name': application_name,
+            'options': f"-c statement_timeout={statement_timeout}",
+        },
+    }
+
+
+def instrument(engine, config):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        stats.incr('connects')
+
+    @event.listens_for(engine, 'close')
+    def on_close(dbapi_connection, connection_record):
+        stats.incr('closes')
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats.incr('invalidations')
+
+    if config['DB_PGBOUNCER']:
+        statement_timeout = int(config['DB_STATEMENT_TIMEOUT'])
+
+        @event.listens_for(engine, 'begin')
+        def on_begin(conn):
+            # the DBAPI cursor opens the transaction which SET LOCAL applies to
+            cursor = conn.connection.dbapi_connection.cursor()
+            cursor.execute(f"SET LOCAL statement_timeout = {statement_timeout}")
+            cursor.close()
+
+
+def snapshot(engine):
+    pool = engine.pool
+    with stats._lock:
+        data = {
+            'pid': stats.pid,
+            'uptime': round(time.time() - stats.started, 1),
+            'pool': type(pool).__name__,
+            'checkouts': stats.checkouts,
+            'checkout_avg_ms': round(1000 * stats.checkout_time / stats.checkouts, 3) if stats.checkouts else 0,
+            'checkout_max_ms': round(1000 * stats.checkout_max, 3),
+            'slow_checkouts': stats.slow_checkouts,
+            'timeouts': stats.timeouts,
+            'checkout_errors': stats.checkout_errors,
+            'connects': stats.connects,
+            'closes': stats.closes,
+            'invalidations': stats.invalidations,
+        }
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + pool._max_overflow
+        data.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': pool.overflow(),
+            'saturation': round(pool.checkedout() / capacity, 3) if capacity > 0 else None,
+        })
+    return data
+
+
+@db_pool_bp.route('/db_pool_stats', methods=['GET'])
+@login_required
+def db_pool_stats():
+    return jsonify(snapshot(db.engine))
@@ -0,0 +1,108 @@
+import time
+import logging
+import itertools
+import threading
+from flask import current_app, session, has_request_context
+from sqlalchemy import text
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# seconds behind the primary, 0 when the replica has replayed everything it
+# has received. NULL on a server which is not in recovery
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+_lag = {}
+_lock = threading.Lock()
+_round_robin = itertools.count()
+
+
+def replica_keys():
+    return sorted(k for k in current_app.config['SQLALCHEMY_BINDS'] if k.startswith('replica_'))
+
+
+def replica_lag(key):
+    """Replication lag of a replica in seconds, or None if it is unreachable.
+    Cached for DB_REPLICA_LAG_CHECK seconds per worker."""
+    return _replica_state(key)[0]
+
+
+def replica_current_to(key):
+    """time.time() before which every transaction committed on the primary
+    had been replayed by a replica when its lag was last checked, or None
+    if it is unreachable."""
+    return _replica_state(key)[1]
+
+
+def _replica_state(key):
+    now = time.monotonic()
+    with _lock:
+        checked, lag, current_to = _lag.get(key, (None, None, None))
+        if checked is not None and now - checked < current_app.config['DB_REPLICA_LAG_CHECK']:
+            return lag, current_to
+        # other threads keep using the old value while this one checks
+        _lag[key] = (now, lag, current_to)
+    try:
+        with db.engines[key].connect() as conn:
+            lag = float(conn.execute(LAG_QUERY).scalar() or 0)
+        current_to = time.time() - lag
+    except Exception as e:
+        logger.warning(f"replica_lag: replica unavailable, replica: {key}, exception: {e}")
+        lag = current_to = None
+    with _lock:
+        _lag[key] = (now, lag, current_to)
+    return lag, current_to
+
+
+def mark_write():
+    """Record that the current user has written to the primary, so that their
+    reads stay on the primary until the replicas have caught up."""
+    if has_request_context():
+        session['last_write'] = time.time()
+
+
+def since_write():
+    """Seconds since the current user's last write, or None."""
+    if has_request_context() and session.get('last_write'):
+        return time.time() - session['last_write']
+    return None
+
+
+def pinned_to_primary():
+    """Whether the current user wrote within the last DB_REPLICA_STICKY
+    seconds, so must read from the primary to see their write."""
+    elapsed = since_write()
+    return elapsed is not None and elapsed < current_app.config['DB_REPLICA_STICKY']
+
+
+def read_engine(changed_at=None):
+    """Engine for read-only queries: a replica which is within
+    DB_REPLICA_MAX_LAG and already has the current user's last write, and
+    had replayed everything committed by time.time() changed_at if given,
+    or the primary if there is none."""
+    keys = replica_keys()
+    if not keys or pinned_to_primary():
+        return db.engine
+    elapsed = since_write()
+
+    start = next(_round_robin)
+    for i in range(len(keys)):
+        key = keys[(start + i) % len(keys)]
+        lag = replica_lag(key)
+        if lag is None or lag > current_app.config['DB_REPLICA_MAX_LAG']:
+            continue
+        if elapsed is not None and lag >= elapsed:
+            continue
+        if changed_at is not None and replica_current_to(key) <= changed_at:
+            continue
+        return db.engines[key]
+
+    logger.debug("read_engine: no replica eligible, using primary")
+    return db.engine
@@ -0,0 +1,78 @@
+import json
+import time
+import queue
+import logging
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from flask_login import login_required, current_user
+
+from extensions import change_feed
+
+logger = logging.getLogger(__name__)
+
+events_bp = Blueprint('events', __name__)
+
+# fields of a change event which are sent to browsers
+EVENT_FIELDS = ('table', 'op', 'key', 'data_dict_uuid', 'status', 'tag', 'job', 'progress')
+
+
+def streams_supported(environ):
+    """Whether a stream can be held open without holding a whole worker,
+    i.e. the server is gevent's, whose workers serve many connections at
+    once (see gunicorn/gunicorn_config.py), or a threaded one."""
+    if environ.get('wsgi.multithread'):
+        return True
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+@events_bp.route('/events', methods=['GET'])
+@login_required
+def events():
+    """Server-sent events stream of database changes and job progress.
+
+    Each stream holds a gevent worker connection, so streams are closed
+    after EVENTS_MAX_DURATION seconds and the browser's EventSource
+    reconnects. Streams of slow clients drop events rather than queueing
+    without limit. On a sync worker, which a stream would hold for its
+    whole duration, no stream is opened: a 204 tells the browser not to
+    reconnect, and the page is only updated by the user's own changes."""
+    user = current_user.email
+    if not streams_supported(request.environ):
+        logger.warning(f"events: stream refused, not running on gevent workers, user: {user}")
+        return Response(status=204)
+    heartbeat = current_app.config['EVENTS_HEARTBEAT']
+    max_duration = current_app.config['EVENTS_MAX_DURATION']
+    events = queue.Queue(maxsize=100)
+
+    def on_change(event):
+        try:
+            events.put_nowait({k: event[k] for k in EVENT_FIELDS if event.get(k) is not None})
+        except queue.Full:
+            pass
+
+    change_feed.subscribe(on_change)
+    logger.debug(f"events: stream opened, user: {user}")
+
+    def generate():
+        end = time.monotonic() + max_duration
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < end:
+                try:
+                    event = events.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            change_feed.unsubscribe(on_change)
+            logger.debug(f"events: stream closed, user: {user}")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'X-Accel-Buffering': 'no'}
+    )
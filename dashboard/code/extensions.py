@@ -1,5 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 
+from audit import AuditWriter
+from change_feed import ChangeFeed
+
 db = SQLAlchemy()
-login_manager = LoginManager()
\ No newline at end of file
+login_manager = LoginManager()
+audit_writer = AuditWriter()
+change_feed = ChangeFeed()
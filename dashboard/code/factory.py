@@ -1,11 +1,18 @@
-from flask import Flask, session, redirect, render_template
+from flask import Flask, session, redirect, render_template, request
 from flask_login import logout_user
 from flask_wtf.csrf import CSRFProtect, CSRFError, generate_csrf
 from flask_talisman import Talisman
 from config import Config
-from extensions import db, login_manager
+from extensions import db, login_manager, audit_writer, change_feed
 from auth import auth_bp
 from minio_routes import minio_bp
+from events import events_bp
+import db_pool
+import query_cache
+import tiles
+import schema
+import backfill
+import geo_pool
 from datetime import datetime, timezone
 
 def create_app():
@@ -16,9 +23,18 @@ def create_app():
     csrf._exempt_views.add('dash.dash.dispatch')
 
     # Initialize extensions
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_pool.engine_options(app.config)
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            db_pool.instrument(engine, app.config)
     login_manager.init_app(app)
     login_manager.login_view = '/login'
+    audit_writer.init_app(app)
+    change_feed.init_app(app)
+    query_cache.cache.init_app(app)
+    tiles.cache.init_app(app)
+    geo_pool.pool.init_app(app)
 
     csp = {
         'default-src': ["'self'"],
@@ -64,11 +80,19 @@ def create_app():
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(minio_bp)
+    app.register_blueprint(db_pool.db_pool_bp)
+    app.register_blueprint(query_cache.query_cache_bp)
+    app.register_blueprint(tiles.tiles_bp)
+    app.register_blueprint(geo_pool.geo_pool_bp)
+    app.register_blueprint(events_bp)
+    schema.register_commands(app)
+    backfill.register_commands(app)
 
     # Logs the user out after inactivity
     @app.before_request
     def session_timeout():
-        session.permanent = True
+        if not session.permanent:
+            session.permanent = True
         now = datetime.now(timezone.utc)
         last_activity = session.get('last_activity')
         if last_activity:
@@ -77,11 +101,18 @@ def create_app():
                 logout_user()
                 session.clear()
                 return redirect('/login?timeout=1')
-        session['last_activity'] = now
+        # the event stream reconnects by itself, which is not user activity
+        if request.path == '/events':
+            return
+        if not last_activity or elapsed > app.config['SESSION_ACTIVITY_INTERVAL']:
+            session['last_activity'] = now
 
     # prevents being able to use back button to return after logging out
     @app.after_request
     def add_header(response):
+        # tiles are revalidated by ETag instead, see tiles.py
+        if request.path.startswith('/tiles/'):
+            return response
         response.headers[
             'Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
         response.headers['Pragma'] = 'no-cache'
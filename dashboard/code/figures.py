@@ -1,10 +1,30 @@
+import json
 import plotly.graph_objects as go
-from dash import dash_table
-import random
-import plotly.colors as pc
+from dash import dash_table, Patch
+import shapely
 
 import utils
 
+DATADICT_PAGE_SIZE = 22
+FILES_PAGE_SIZE = 8
+
+DATADICT_HIDDEN_COLUMNS = [
+    'record_insert_time', 'reference_documentation', 'notes',
+    'field_delimiter', 'field_types', 'field_names', 'description',
+    'filename_extensions', 'produced_by', 'ingested_by', 'modified_by',
+    'mime_types', 'owner_count'
+]
+FILES_HIDDEN_COLUMNS = [
+    'status', 'deletion_time', 'model_domain', 'data_dict_uuid',
+    'minio_filename', 'minio_bucket', 'description', 'size', 'gis',
+    'filename_extension', 'clamav_scan'
+]
+SEARCH_HIDDEN_COLUMNS = ['data_dict_uuid']
+
+# shorter values fit in a table cell, so are not given a tooltip
+TOOLTIP_MIN_LENGTH = 16
+
+
 def default_map():
     fig = go.Figure()
     fig.add_trace(go.Scattermapbox())
@@ -18,45 +38,6 @@ def default_map():
                 lon=-3.5
             ),
             'zoom': 4.7,
-        }
-    )
-    return fig
-
-
-def update_map(df, existing_traces, current_figure, lat, lon, zoom):
-    fig = go.Figure(current_figure)
-
-    for idx, row in df.iterrows():
-
-        display_name = row['filename'] + ' | ' + str(row['uuid'])
-        if display_name in existing_traces:
-            continue
-
-        poly = row['polygon']
-        lons, lats = poly.exterior.coords.xy
-        fig.add_trace(go.Scattermapbox(
-            lon=list(lons),
-            lat=list(lats),
-            mode='lines',
-            fill='toself',
-            line=dict(
-                width=2,
-                color=pc.sample_colorscale("Viridis", random.random())[0]
-            ),
-            name=display_name,
-            hoverinfo='text',
-            hovertext=display_name,
-            showlegend=True
-        ))
-
-    fig.update_layout(
-        mapbox={
-            'style': 'carto-positron',
-            'center': go.layout.mapbox.Center(
-                lat=lat,
-                lon=lon
-            ),
-            'zoom': zoom,
         },
         legend=dict(
             x=0.01,  # x position in paper coordinates (0=left, 1=right)
@@ -64,43 +45,123 @@ def update_map(df, existing_traces, current_figure, lat, lon, zoom):
             xanchor="left",
             yanchor="top"
         ),
+        # Transparent background
+        plot_bgcolor='rgba(0, 0, 0, 0)',
+        paper_bgcolor='rgba(0, 0, 0, 0)',
     )
+    return fig
+
+
+def spatial_search_map():
+    fig = default_map()
+    fig.update_layout(dragmode='select', uirevision='spatial-search')
+    return fig
+
+
+def map_trace_name(filename, uuid):
+    return f"{filename} | {uuid}"
 
-    fig.update_xaxes(gridcolor='#ececec')
-    fig.update_yaxes(gridcolor='#ececec')
-    # Transparent background
-    fig.update_layout({'plot_bgcolor': 'rgba(0, 0, 0, 0)',
-                       'paper_bgcolor': 'rgba(0, 0, 0, 0)'})
 
+# index of the footprints trace, after default_map's empty trace
+FOOTPRINTS_TRACE = 1
+
+
+def footprints(names, uuids, geometries):
+    """Features, locations, colours and hover text for footprints_trace,
+    from arrays of names, file uuids and shapely geometries."""
+    features = [
+        {'type': 'Feature', 'id': uuid, 'geometry': json.loads(geometry)}
+        for uuid, geometry in zip(uuids, shapely.to_geojson(geometries))
+    ]
+    # a colour which stays the same for a file across updates
+    z = [int(uuid[:8], 16) / 0xffffffff for uuid in uuids]
+    return {
+        'features': features,
+        'locations': list(uuids),
+        'z': z,
+        'text': list(names),
+    }
+
+
+def footprints_trace(added):
+    """All the file footprints on the Map, as one layer drawn from one
+    GeoJSON FeatureCollection. Lists are kept as lists, rather than arrays
+    which plotly would encode as binary, so update_map can patch them."""
+    return go.Choroplethmapbox(
+        geojson={'type': 'FeatureCollection', 'features': added['features']},
+        locations=added['locations'],
+        z=added['z'],
+        text=added['text'],
+        colorscale='Viridis',
+        zmin=0,
+        zmax=1,
+        showscale=False,
+        marker={'opacity': 0.4, 'line': {'width': 2, 'color': '#404040'}},
+        hoverinfo='text',
+    ).to_plotly_json()
+
+
+def map_view(lat, lon, zoom):
+    return {'center': {'lat': lat, 'lon': lon}, 'zoom': zoom}
+
+
+def update_map(added, removed, lat, lon, zoom):
+    """Patch for the Map figure which removes the footprints at the indexes
+    in removed, appends those in added and moves the view, so only the
+    change is sent to the browser."""
+    patched = Patch()
+    trace = patched['data'][FOOTPRINTS_TRACE]
+    arrays = [trace['geojson']['features'], trace['locations'], trace['z'], trace['text']]
+    # from the highest index down, so the other indexes are not shifted
+    for index in sorted(removed, reverse=True):
+        for array in arrays:
+            del array[index]
+    for array, key in zip(arrays, ('features', 'locations', 'z', 'text')):
+        if added[key]:
+            array.extend(added[key])
+    patched['layout']['mapbox'].update(map_view(lat, lon, zoom))
+    return patched
+
+
+def new_map(added, lat, lon, zoom):
+    fig = default_map()
+    fig.add_trace(footprints_trace(added))
+    fig.update_layout(mapbox=map_view(lat, lon, zoom))
     return fig
 
 
-def dataDictTable(df):
-    df = df[['name'] + [c for c in df.columns if c != 'name']]
-    df = df[[c for c in df.columns if c != 'uuid'] + ['uuid']]
-    data = [utils.convert_record(row) for row in df.to_dict('records')]
+def table_records(df, hidden_columns=()):
+    """Records for a DataTable, with tooltips for the visible cells which
+    may be cut off."""
+    return utils.serialize_frame(
+        df,
+        tooltip_columns=[c for c in df.columns if c not in hidden_columns],
+        tooltip_min_length=TOOLTIP_MIN_LENGTH
+    )
+
+
+def dataDictTable(columns):
+    """The catalogue table, empty. Its rows are filtered from the catalogue
+    store in the browser, see filterCatalogue in assets/ui.js."""
+    columns = ['name'] + [c for c in columns if c not in ('name', 'uuid')] + ['uuid']
     return dash_table.DataTable(
         id='datadict-table',
         columns=[
             {'name': str(x),'id': str(x), 'deletable': False,}
-            for x in df.columns
-        ],
-        hidden_columns=[
-            'record_insert_time', 'reference_documentation', 'notes',
-            'field_delimiter', 'field_types', 'field_names', 'description',
-            'filename_extensions', 'produced_by', 'ingested_by', 'modified_by',
-            'mime_types'
+            for x in columns
         ],
-        data=data,
+        hidden_columns=DATADICT_HIDDEN_COLUMNS,
+        data=[],
         editable=False,
         row_deletable=False,
         row_selectable='single',
         # filter_action="native",
         sort_action="native",
         sort_mode="single",
+        sort_by=[],
         page_action='native',
         page_current=0,
-        page_size=22,
+        page_size=DATADICT_PAGE_SIZE,
         style_table={'height': '700px', 'overflowY': 'auto'},
         style_header={'fontSize': '14px'},
         style_cell={
@@ -121,43 +182,36 @@ def dataDictTable(df):
                 'rule': 'display: none'
             }
         ],
-        tooltip_data=[
-            {
-                column: {'value': str(value), 'type': 'markdown'}
-                for column, value in row.items()
-            } for row in df.to_dict('records')
-        ],
+        tooltip_data=[],
         tooltip_duration=None,
         fixed_rows={'headers': True}
     )
 
 
-def associatedFilesTable(df, selected):
-    df = df.drop(columns=['spatial_extents'])
+def associatedFilesTable(df, selected, page_count):
     df = df[['filename'] + [c for c in df.columns if c != 'filename']]
-    data = [utils.convert_record(row) for row in df.to_dict('records')]
+    data, tooltip_data = table_records(df, FILES_HIDDEN_COLUMNS)
     return dash_table.DataTable(
         id='associated-files-table',
         columns=[
             {'name': str(x), 'id': str(x), 'deletable': False,}
             for x in df.columns
         ],
-        hidden_columns=[
-            'status', 'deletion_time', 'model_domain', 'data_dict_uuid',
-            'minio_filename', 'minio_bucket', 'description', 'size', 'gis',
-            'filename_extension', 'clamav_scan'
-        ],
+        hidden_columns=FILES_HIDDEN_COLUMNS,
         data=data, #df.to_dict('records'),
         editable=False,
         row_deletable=False,
         row_selectable='multi',
         selected_rows=selected,
-        filter_action="native",
-        sort_action="native",
+        filter_action="custom",
+        filter_query='',
+        sort_action="custom",
         sort_mode="single",
-        page_action='native',
+        sort_by=[],
+        page_action='custom',
         page_current=0,
-        page_size=8,
+        page_size=FILES_PAGE_SIZE,
+        page_count=page_count,
         style_header={'fontSize': '14px'},
         style_table={
             'height': '300px',
@@ -181,18 +235,88 @@ def associatedFilesTable(df, selected):
             'maxWidth': 0,
             'fontSize': '12px',
         },
-        tooltip_data=[
-            {
-                column: {'value': str(value), 'type': 'markdown'}
-                for column, value in row.items()
-            } for row in df.to_dict('records')
+        tooltip_data=tooltip_data,
+        tooltip_duration=None,
+        fixed_rows={'headers': True}
+    )
+
+
+def spatialSearchTable(df, page_count):
+    data, tooltip_data = table_records(df, SEARCH_HIDDEN_COLUMNS)
+    return dash_table.DataTable(
+        id='spatial-search-table',
+        columns=[
+            {'name': str(x), 'id': str(x), 'deletable': False}
+            for x in df.columns
+        ],
+        hidden_columns=SEARCH_HIDDEN_COLUMNS,
+        data=data,
+        editable=False,
+        row_deletable=False,
+        page_action='custom',
+        page_current=0,
+        page_size=FILES_PAGE_SIZE,
+        page_count=page_count,
+        style_header={'fontSize': '14px'},
+        style_table={'height': '300px', 'overflowY': 'auto'},
+        css=[
+            {  # hides the 'Toggle Columns' button which appears when using
+                # hidden_columns
+                'selector': '.show-hide',
+                'rule': 'display: none'
+            }
         ],
+        style_cell={
+            'textAlign': 'left',
+            'overflow': 'hidden',
+            'textOverflow': 'ellipsis',
+            'maxWidth': 0,
+            'fontSize': '12px',
+        },
+        tooltip_data=tooltip_data,
         tooltip_duration=None,
         fixed_rows={'headers': True}
     )
 
 
+def textSearchTable(df, page_count):
+    data, _ = utils.serialize_frame(df)
+    return dash_table.DataTable(
+        id='text-search-table',
+        columns=[
+            {'name': 'type', 'id': 'type'},
+            {'name': 'name', 'id': 'name'},
+            {'name': 'snippet', 'id': 'snippet', 'presentation': 'markdown'},
+            {'name': 'uuid', 'id': 'uuid'},
+            {'name': 'data_dict_uuid', 'id': 'data_dict_uuid'},
+        ],
+        hidden_columns=SEARCH_HIDDEN_COLUMNS,
+        data=data,
+        editable=False,
+        row_deletable=False,
+        page_action='custom',
+        page_current=0,
+        page_size=FILES_PAGE_SIZE,
+        page_count=page_count,
+        style_header={'fontSize': '14px'},
+        style_table={'overflowY': 'auto'},
+        css=[
+            {  # hides the 'Toggle Columns' button which appears when using
+                # hidden_columns
+                'selector': '.show-hide',
+                'rule': 'display: none'
+            }
+        ],
+        style_cell={
+            'textAlign': 'left',
+            'whiteSpace': 'normal',
+            'fontSize': '12px',
+        },
+    )
+
+
 def deleteTable(df):
+    data, tooltip_data = table_records(df, FILES_HIDDEN_COLUMNS)
     return [
         dash_table.DataTable(
             id='delete-table',
@@ -200,12 +324,8 @@ def deleteTable(df):
                 {'name': str(x), 'id': str(x), 'deletable': False}
                 for x in df.columns
             ],
-            hidden_columns=[
-                'status', 'deletion_time', 'model_domain', 'data_dict_uuid',
-                'minio_filename', 'minio_bucket', 'description', 'size', 'gis',
-                'filename_extension', 'clamav_scan'
-            ],
-            data=df.to_dict('records'),
+            hidden_columns=FILES_HIDDEN_COLUMNS,
+            data=data,
             editable=False,
             row_deletable=False,
             sort_action="native",
@@ -225,11 +345,7 @@ def deleteTable(df):
                     'rule': 'display: none'
                 }
             ],
-            tooltip_data=[
-                {column: {'value': str(value), 'type': 'markdown'}}
-                for row in df.to_dict('records')
-                for column, value in row.items()
-            ],
+            tooltip_data=tooltip_data,
             tooltip_duration=None,
             fixed_rows={'headers': True}
         ),
@@ -1,98 +1,375 @@
 import geopandas as gpd
+import pyogrio
+import numpy as np
+import shapely
 from shapely.geometry import box
 from pyproj import Transformer, CRS
+import struct
+from functools import lru_cache
 import tempfile
 import zipfile
 import os
-import glob
+import logging
 
 import utils
+import geo_pool
 
-def geopackage(filepath, crs=4326):
-    print(filepath)
-    gdf = gpd.read_file(filepath)
+logger = logging.getLogger(__name__)
 
-    minx, miny, maxx, maxy = gdf.total_bounds
-    print("Spatial extents in source CRS:", (minx, miny, maxx, maxy))
+# features read at a time, so large datasets are not held in memory at once
+BATCH_SIZE = 10000
+# partial unions kept before they are merged
+MAX_PARTIALS = 16
+# layers of a GeoPackage, or shapefiles in a zip
+MAX_LAYERS = 32
 
-    src_crs = gdf.crs
-    if src_crs is None:
-        raise ValueError("No CRS found in the GeoPackage. Please define the source CRS.")
+# footprint columns of Objects and their tolerance in degrees, cheapest
+# first. footprint_hull is the convex hull of each part of footprint_coarse
+FOOTPRINT_TOLERANCES = {
+    'footprint_coarse': 0.01,
+    'footprint_fine': 0.001,
+}
+FOOTPRINT_COLUMNS = ['footprint_hull', 'footprint_coarse', 'footprint_fine']
+
+
+def dissolve(geometries, tolerance):
+    """Union of geometries grown by tolerance, so nearby features, points
+    and lines merge into areas, then simplified by it."""
+    grown = shapely.buffer(geometries, tolerance, quad_segs=2)
+    return shapely.simplify(shapely.union_all(grown), tolerance)
+
+
+def hulls(geometry):
+    # a hull per part, so islands and data either side of the dateline are
+    # not joined across the space between them
+    return shapely.union_all(shapely.convex_hull(shapely.get_parts(geometry)))
+
+
+def footprints(path, layer=None, name=None, crs=4326):
+    """Metadata, bounding box and footprints, in crs, of a layer of a file,
+    named name if the file does not name its layers, as a dict of the Layers
+    columns and FOOTPRINT_COLUMNS, with None for the geometries if the layer
+    has no features. It is read BATCH_SIZE features at a time, each batch
+    dissolved and merged into the union so far, so memory is bounded by the
+    footprint rather than the dataset."""
+    info = pyogrio.read_info(path, layer=layer)
+    if info['crs'] is None:
+        raise ValueError("No CRS found; include a .prj or define the source CRS.")
+    fine = FOOTPRINT_TOLERANCES['footprint_fine']
+    partials = []
+    bounds = []
+    count = 0
+    while True:
+        gdf = gpd.read_file(path, layer=layer, rows=slice(count, count + BATCH_SIZE))
+        count += len(gdf)
+        if len(gdf) > 0:
+            geometries = gdf.to_crs(epsg=crs).geometry.to_numpy()
+            geometries = geometries[~(shapely.is_missing(geometries) | shapely.is_empty(geometries))]
+            if len(geometries) > 0:
+                geometries = shapely.make_valid(geometries)
+                bounds.append(shapely.total_bounds(geometries))
+                partials.append(dissolve(geometries, fine))
+                if len(partials) >= MAX_PARTIALS:
+                    partials = [shapely.union_all(partials)]
+        if len(gdf) < BATCH_SIZE:
+            break
+
+    result = {
+        'name': layer or name,
+        'geometry_type': info['geometry_type'],
+        'feature_count': count,
+        'source_crs': info['crs'],
+        'spatial_extents': None,
+        **dict.fromkeys(FOOTPRINT_COLUMNS),
+    }
+    if not bounds:
+        # e.g. an empty template layer of a GeoPackage
+        return result
+    bounds = np.array(bounds)
+    footprint_fine = shapely.simplify(shapely.union_all(partials), fine)
+    footprint_coarse = dissolve(footprint_fine, FOOTPRINT_TOLERANCES['footprint_coarse'])
+    result.update(
+        spatial_extents=box(*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)),
+        footprint_hull=hulls(footprint_coarse),
+        footprint_coarse=footprint_coarse,
+        footprint_fine=footprint_fine,
+    )
+    return result
+
+
+def combine(layers):
+    """Bounding box and footprints of an object from those of its layers."""
+    if len(layers) == 1:
+        levels = {column: layers[0][column] for column in FOOTPRINT_COLUMNS}
     else:
-        print("source CRS:", src_crs)
+        levels = {
+            column: shapely.union_all([layer[column] for layer in layers])
+            for column in ('footprint_coarse', 'footprint_fine')
+        }
+        levels['footprint_hull'] = hulls(levels['footprint_coarse'])
+    bounds = np.array([layer['spatial_extents'].bounds for layer in layers])
+    extents = box(*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+    return extents.wkt, {column: levels[column].wkt for column in FOOTPRINT_COLUMNS}
 
-    target_crs = CRS.from_epsg(crs)
 
-    # Create a transformer from the source CRS to target CRS
-    transformer = Transformer.from_crs(src_crs, target_crs, always_xy=True)
+RASTER_EXTENSIONS = ('.asc', '.tif', '.tiff')
+# extensions extents can be extracted from
+EXTENSIONS = ('.gpkg', '.zip') + RASTER_EXTENSIONS
+# bytes read for an ESRI ASCII grid header, which is six short lines
+ASCII_HEADER_SIZE = 1024
 
-    # Transform the lower-left and upper-right corners
-    bl_x, bl_y = transformer.transform(minx, miny)
-    tr_x, tr_y = transformer.transform(maxx, maxy)
-    print("Transformed spatial extents:", (bl_x, bl_y, tr_x, tr_y))
+# TIFF tags and GeoTIFF keys used for extents
+TIFF_IMAGE_WIDTH = 256
+TIFF_IMAGE_LENGTH = 257
+TIFF_MODEL_PIXEL_SCALE = 33550
+TIFF_MODEL_TIEPOINT = 33922
+TIFF_MODEL_TRANSFORMATION = 34264
+TIFF_GEO_KEY_DIRECTORY = 34735
+GEOKEY_RASTER_TYPE = 1025
+GEOKEY_GEOGRAPHIC_TYPE = 2048
+GEOKEY_PROJECTED_TYPE = 3072
+GEOKEY_USER_DEFINED = 32767
+RASTER_PIXEL_IS_POINT = 2
+# struct formats of TIFF field types, by type code
+TIFF_TYPES = {
+    1: 'B', 2: 's', 3: 'H', 4: 'I', 5: 'II', 6: 'b', 7: 'B', 8: 'h', 9: 'i',
+    10: 'ii', 11: 'f', 12: 'd', 16: 'Q', 17: 'q', 18: 'Q',
+}
 
-    # Create a polygon (bounding box) from the original bounds
-    original_polygon = box(minx, miny, maxx, maxy)
 
-    # Reproject the polygon to the target CRS using GeoPandas' to_crs
-    gdf_proj = gdf.to_crs(epsg=crs)
-    projected_polygon = box(*gdf_proj.total_bounds)
-    print("WKT:", projected_polygon.wkt)
+def ascii_grid(read):
+    """Corners and CRS (None, it has none) of an ESRI ASCII grid from its
+    header. read(offset, length) returns bytes of the file, so only the
+    first ASCII_HEADER_SIZE bytes are read, however large the grid."""
+    header = {}
+    for line in read(0, ASCII_HEADER_SIZE).decode('ascii', errors='replace').splitlines():
+        parts = line.split()
+        if len(parts) != 2 or parts[0][0].isdigit() or parts[0][0] in '-.':
+            # the first row of values
+            break
+        header[parts[0].lower()] = float(parts[1])
+    try:
+        ncols, nrows = header['ncols'], header['nrows']
+        dx = header.get('dx', header.get('cellsize'))
+        dy = header.get('dy', header.get('cellsize'))
+        if dx is None or dy is None:
+            raise ValueError("ESRI ASCII grid header has no cellsize")
+        if 'xllcorner' in header:
+            minx, miny = header['xllcorner'], header['yllcorner']
+        else:
+            minx, miny = header['xllcenter'] - dx / 2, header['yllcenter'] - dy / 2
+    except KeyError:
+        raise ValueError("Not an ESRI ASCII grid header")
+    return box(minx, miny, minx + ncols * dx, miny + nrows * dy), None
 
-    return projected_polygon.wkt
 
+def tiff_tags(read, tags):
+    """Values of tags in the first image of a TIFF or BigTIFF, read through
+    read(offset, length) a few bytes at a time instead of from the whole
+    file."""
+    header = read(0, 16)
+    if header[:2] == b'II':
+        order = '<'
+    elif header[:2] == b'MM':
+        order = '>'
+    else:
+        raise ValueError("Not a TIFF file")
+    version, = struct.unpack(order + 'H', header[2:4])
+    if version == 42:
+        offset, = struct.unpack(order + 'I', header[4:8])
+        count_format, entry_format, inline = 'H', 'HHI4s', 4
+    elif version == 43:
+        offset, = struct.unpack(order + 'Q', header[8:16])
+        count_format, entry_format, inline = 'Q', 'HHQ8s', 8
+    else:
+        raise ValueError("Not a TIFF file")
 
-def shapefile(path_or_dir, filepath, crs=4326):
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with zipfile.ZipFile(path_or_dir, 'r') as z:
-            z.extractall(tmpdir)
+    count_size = struct.calcsize(order + count_format)
+    entry_size = struct.calcsize(order + entry_format)
+    count, = struct.unpack(order + count_format, read(offset, count_size))
+    entries = read(offset + count_size, count * entry_size)
+    values = {}
+    for i in range(count):
+        tag, kind, n, value = struct.unpack_from(order + entry_format, entries, i * entry_size)
+        if tag not in tags or kind not in TIFF_TYPES:
+            continue
+        value_format = f"{order}{n * len(TIFF_TYPES[kind])}{TIFF_TYPES[kind][0]}"
+        if kind == 2:
+            value_format = f"{order}{n}s"
+        size = struct.calcsize(value_format)
+        if size > inline:
+            value_offset, = struct.unpack(order + ('I' if inline == 4 else 'Q'), value)
+            value = read(value_offset, size)
+        values[tag] = struct.unpack(value_format, value[:size])
+    return values
 
-        path = tmpdir + '/' + filepath.replace(".zip", "")
 
-        # Directory → find .shp inside
-        if os.path.isdir(path):
-            shp_list = glob.glob(os.path.join(path, '*.shp'))
-            if not shp_list:
-                raise ValueError(f"No .shp found in directory {path}")
+def geotiff(read):
+    """Corners and EPSG code (None if not given) of a GeoTIFF from its tags,
+    without reading the image."""
+    tags = tiff_tags(read, {
+        TIFF_IMAGE_WIDTH, TIFF_IMAGE_LENGTH, TIFF_MODEL_PIXEL_SCALE,
+        TIFF_MODEL_TIEPOINT, TIFF_MODEL_TRANSFORMATION, TIFF_GEO_KEY_DIRECTORY,
+    })
+    try:
+        width, = tags[TIFF_IMAGE_WIDTH]
+        height, = tags[TIFF_IMAGE_LENGTH]
+    except KeyError:
+        raise ValueError("TIFF has no image size")
 
-        if not utils.validate_shapefile_directory(path):
-            raise ValueError("Shapefile directory not valid")
+    keys = {}
+    directory = tags.get(TIFF_GEO_KEY_DIRECTORY, ())
+    for i in range(4, len(directory) - 3, 4):
+        key, location, _, value = directory[i:i + 4]
+        # keys stored in other tags are not needed for extents
+        if location == 0:
+            keys[key] = value
+    # the pixel corners are half a pixel from the tie points of
+    # PixelIsPoint rasters
+    shift = 0.5 if keys.get(GEOKEY_RASTER_TYPE) == RASTER_PIXEL_IS_POINT else 0
 
-        gdf = gpd.read_file(shp_list[0])
+    corners = np.array([(0, 0), (width, 0), (width, height), (0, height)], dtype=float) - shift
+    if TIFF_MODEL_TRANSFORMATION in tags:
+        a, b, _, d, e, f, _, h = tags[TIFF_MODEL_TRANSFORMATION][:8]
+        points = corners @ np.array([[a, e], [b, f]]) + (d, h)
+    elif TIFF_MODEL_PIXEL_SCALE in tags and TIFF_MODEL_TIEPOINT in tags:
+        sx, sy, _ = tags[TIFF_MODEL_PIXEL_SCALE]
+        i, j, _, x, y, _ = tags[TIFF_MODEL_TIEPOINT][:6]
+        points = (x, y) + (corners - (i, j)) * (sx, -sy)
+    else:
+        raise ValueError("TIFF has no georeferencing")
 
-        # Compute original bounds
-        minx, miny, maxx, maxy = gdf.total_bounds
-        src_crs = gdf.crs
-        if src_crs is None:
-            raise ValueError("No CRS found on shapefile; include a .prj or set CRS manually.")
+    epsg = None
+    for key in (GEOKEY_PROJECTED_TYPE, GEOKEY_GEOGRAPHIC_TYPE):
+        if keys.get(key) not in (None, 0, GEOKEY_USER_DEFINED):
+            epsg = keys[key]
+            break
+    return shapely.Polygon(points), epsg
 
-        # Reproject bounds manually
-        transformer = Transformer.from_crs(src_crs, CRS.from_epsg(crs), always_xy=True)  # :contentReference[oaicite:1]{index=1}
-        bl_x, bl_y = transformer.transform(minx, miny)
-        tr_x, tr_y = transformer.transform(maxx, maxy)
 
-        # Also build polygon via to_crs
-        gdf_proj = gdf.to_crs(epsg=crs)
-        projected_polygon = box(*gdf_proj.total_bounds)
-        return projected_polygon.wkt
+@lru_cache(maxsize=32)
+def transformer(source_epsg, target_epsg):
+    # building a transformer takes longer than reading a raster's header
+    return Transformer.from_crs(
+        CRS.from_epsg(source_epsg), CRS.from_epsg(target_epsg), always_xy=True
+    )
 
 
-def main(filepath, decoded, crs=4326):
-    suffix = "." + filepath.split(".")[-1]
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-        tmp.write(decoded)
-        tmp.flush()  # Ensure all data is written
-        tmp_filename = tmp.name  # Store filename for reading
+def raster(filepath, read, crs=4326, source_crs=None):
+    """Bounding box and footprints of a raster from its header, as WKT, in
+    the form combine() returns, using source_crs if the file has no CRS, as
+    ESRI ASCII grids never do. A raster's footprint is its outline at every
+    level."""
+    if filepath.endswith('.asc'):
+        outline, epsg = ascii_grid(read)
+    else:
+        outline, epsg = geotiff(read)
+    epsg = epsg or source_crs
+    if epsg is None:
+        raise ValueError("No CRS found for the raster; set RASTER_SOURCE_CRS.")
+
+    # the edges are densified so they follow the curve of the reprojection
+    minx, miny, maxx, maxy = outline.bounds
+    outline = shapely.segmentize(outline, max(maxx - minx, maxy - miny) / 16)
+    to_crs = transformer(epsg, crs)
+    projected = shapely.transform(
+        outline, lambda c: np.column_stack(to_crs.transform(c[:, 0], c[:, 1]))
+    )
+    if not projected.is_valid or not np.isfinite(projected.bounds).all():
+        raise ValueError(f"Raster extents are not valid in EPSG:{epsg}")
+    return box(*projected.bounds).wkt, dict.fromkeys(FOOTPRINT_COLUMNS, projected.wkt)
+
 
+def vector_layers(filepath, path):
+    """(path, layer, name) for each layer of a vector file: the spatial
+    layers of a GeoPackage, or each shapefile in a zip, named by its path
+    in the zip. Shapefiles are checked from
+    the zip's central directory, then read by GDAL straight from the
+    archive, so only the members it needs are inflated, as it reads them."""
     if filepath.endswith('.gpkg'):
-        extents = geopackage(tmp_filename)
-        tmp.close()
-        return extents
+        layers = [
+            (path, name, name) for name, geometry_type in pyogrio.list_layers(path)
+            if geometry_type is not None
+        ]
     elif filepath.endswith('.zip'):
-        extents = shapefile(tmp_filename, filepath)
-        tmp.close()
-        return extents
+        with zipfile.ZipFile(path, 'r') as z:
+            shp_list = utils.validate_shapefile_archive(z.infolist())
+        layers = [(f"/vsizip/{path}/{shp}", None, os.path.splitext(shp)[0]) for shp in shp_list]
     else:
-        tmp.close()
         raise ValueError("Not a valid extension")
+    if not layers:
+        raise ValueError("No spatial layers found")
+    if len(layers) > MAX_LAYERS:
+        raise ValueError(f"File contains {len(layers)} layers; maximum allowed is {MAX_LAYERS}.")
+    return layers
+
+
+def extract(filepath, path, crs=4326, raster_crs=None, pool=None):
+    """Extents, footprints and layers of the file at path, which was
+    uploaded as filepath. The layers of a vector file are read at once in
+    the processes of pool, so a file takes about as long as its largest
+    layer. Layers which are empty or cannot be read are kept without
+    extents, and the object's extents are those of the others; it fails
+    only if no layer has any. Rasters have no layers."""
+    if filepath.endswith(RASTER_EXTENSIONS):
+        with open(path, 'rb') as f:
+            def read(offset, length):
+                f.seek(offset)
+                return f.read(length)
+            extents, levels = raster(filepath, read, crs, raster_crs)
+        return extents, levels, []
+
+    pool = pool or geo_pool.pool
+    paths, layer_names, names = zip(*vector_layers(filepath, path))
+    results = pool.map(
+        footprints, paths, layer_names, names, [crs] * len(paths), return_exceptions=True
+    )
+    layers = []
+    errors = []
+    for name, result in zip(names, results):
+        if isinstance(result, (geo_pool.Cancelled, TimeoutError)):
+            # the upload is given up, not the layer
+            raise result
+        if isinstance(result, Exception):
+            logger.warning(f"geo_ingestion: layer skipped, filename: {filepath}, layer: {name}, exception: {result}")
+            errors.append(result)
+            result = {
+                'name': name, 'geometry_type': None, 'feature_count': None,
+                'source_crs': None, 'spatial_extents': None,
+            }
+        layers.append(result)
+
+    found = [layer for layer in layers if layer['spatial_extents'] is not None]
+    if not found:
+        raise errors[0] if errors else ValueError("No geometries found")
+    # unions of large footprints, so not in this process either
+    extents, levels = pool.run(combine, found)
+    for layer in layers:
+        # Layers rows, which keep only the bounding box
+        for column in FOOTPRINT_COLUMNS:
+            layer.pop(column, None)
+        if layer['spatial_extents'] is not None:
+            layer['spatial_extents'] = layer['spatial_extents'].wkt
+    return extents, levels, layers
+
+
+def main(filepath, decoded, crs=4326, raster_crs=None):
+    if filepath.endswith(RASTER_EXTENSIONS):
+        extents, levels = raster(
+            filepath, lambda offset, length: decoded[offset:offset + length],
+            crs, raster_crs
+        )
+        return extents, levels, []
+
+    suffix = "." + filepath.split(".")[-1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(decoded)
+        tmp.flush()  # Ensure all data is written
+        tmp_filename = tmp.name  # Store filename for reading
 
+    try:
+        # layers are read in worker processes, so the web worker keeps
+        # serving requests
+        return extract(filepath, tmp_filename, crs, raster_crs)
+    finally:
+        os.remove(tmp_filename)
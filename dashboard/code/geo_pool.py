@@ -0,0 +1,267 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, jsonify
+from flask_login import login_required
+
+logger = logging.getLogger(__name__)
+
+geo_pool_bp = Blueprint('geo_pool', __name__)
+
+# imported once by the fork server, so each worker process starts with
+# them loaded instead of importing them again
+PRELOAD = ['geo_ingestion', 'geopandas', 'pyogrio', 'fiona', 'pyproj', 'shapely']
+
+COUNTERS = ('tasks', 'errors', 'timeouts', 'cancellations', 'recycled')
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _warm():
+    # opens the PROJ database, which is otherwise done by the first task
+    import geo_ingestion
+    geo_ingestion.transformer(27700, 4326)
+
+
+def _serve(conn):
+    """Run tasks sent over conn until it is closed."""
+    _warm()
+    while True:
+        try:
+            func, args, kwargs = conn.recv()
+        except EOFError:
+            return
+        try:
+            result = (True, func(*args, **kwargs))
+        except Exception as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # the exception or result could not be pickled
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class Worker:
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        # under gevent the pipe is a patched socket pair, which is left
+        # non-blocking, and the unpatched worker process could not read it
+        os.set_blocking(self.conn.fileno(), True)
+        os.set_blocking(child_conn.fileno(), True)
+        self.process = context.Process(target=_serve, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self):
+        self.conn.close()
+        self.process.kill()
+        self.process.join()
+
+    def close(self):
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class GeoPool:
+    """Worker processes for CPU-heavy geospatial work, so it holds neither
+    the GIL nor the event loop of a web worker while it runs.
+
+    Processes are forked from a fork server which has PRELOAD imported, and
+    are kept between tasks. Each is replaced after max_tasks tasks, which
+    returns the memory geopandas and GDAL tend to keep. A task which runs
+    past its timeout, or is cancelled, has its process killed, as a running
+    task cannot be stopped any other way.
+
+    Functions and arguments are pickled, so functions must be importable
+    module-level functions. Each web worker starts its own processes, with
+    start() once it has loaded the app (see gunicorn/gunicorn_config.py),
+    or otherwise the first time it runs a task.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = []
+        self._slots = None
+        self._context = None
+        self._pid = None
+        self._stats = dict.fromkeys(COUNTERS, 0)
+        self.enabled = False
+        self.size = 1
+        self.max_tasks = 20
+        self.timeout = None
+
+    def init_app(self, app):
+        self.configure(
+            enabled=app.config['GEO_POOL_ENABLED'],
+            size=app.config['GEO_POOL_SIZE'],
+            max_tasks=app.config['GEO_POOL_MAX_TASKS'],
+            timeout=app.config['GEO_POOL_TIMEOUT'],
+        )
+
+    def configure(self, **settings):
+        """Change settings, e.g. the size for a command line job. Takes
+        effect for processes started afterwards."""
+        self.close()
+        for name, value in settings.items():
+            setattr(self, name, value)
+        with self._lock:
+            self._pid = None
+
+    def run(self, func, *args, timeout=None, cancel=None, **kwargs):
+        """func(*args, **kwargs) in a worker process. Waits for a free
+        process, then raises TimeoutError if the task takes longer than
+        timeout (default the pool's), or Cancelled once the threading.Event
+        cancel is set. Exceptions raised by func are raised here."""
+        if not self.enabled:
+            return func(*args, **kwargs)
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._checkout(timeout)
+        try:
+            worker.conn.send((func, args, kwargs))
+            deadline = None if timeout is None else time.monotonic() + timeout
+            # polled in short steps so that cancel is noticed
+            while not worker.conn.poll(0.1):
+                if cancel is not None and cancel.is_set():
+                    self._count('cancellations')
+                    raise Cancelled(f"{func.__name__} cancelled")
+                if deadline is not None and time.monotonic() > deadline:
+                    self._count('timeouts')
+                    raise TimeoutError(f"{func.__name__} took longer than {timeout}s")
+            ok, value = worker.conn.recv()
+        except BaseException:
+            # includes the caller being killed while it waits
+            worker.kill()
+            self._slots.release()
+            raise
+        self._checkin(worker)
+        self._count('tasks')
+        if not ok:
+            self._count('errors')
+            raise value
+        return value
+
+    def map(self, func, *iterables, timeout=None, cancel=None, return_exceptions=False):
+        """List of func applied to the items of iterables, run at once in up
+        to size processes, as run() runs one. The first exception raised by
+        a task is raised once every task has finished, or with
+        return_exceptions, each is returned in place of its result."""
+        def call(args):
+            try:
+                return self.run(func, *args, timeout=timeout, cancel=cancel)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        calls = list(zip(*iterables))
+        if not self.enabled or len(calls) <= 1:
+            return [call(args) for args in calls]
+        with ThreadPoolExecutor(min(len(calls), self.size)) as threads:
+            futures = [threads.submit(call, args) for args in calls]
+        return [future.result() for future in futures]
+
+    def start(self):
+        """Start and warm size processes now, so that the first task does not
+        wait for the fork server to import PRELOAD, or for a process."""
+        if not self.enabled:
+            return
+        self._ensure_started()
+        started = time.monotonic()
+        workers = []
+        try:
+            while len(workers) < self.size and self._slots.acquire(blocking=False):
+                with self._lock:
+                    worker = self._idle.pop() if self._idle else None
+                try:
+                    workers.append(worker or Worker(self._context))
+                except BaseException:
+                    self._slots.release()
+                    raise
+        finally:
+            with self._lock:
+                self._idle.extend(workers)
+            for _ in workers:
+                self._slots.release()
+        logger.info(
+            f"geo pool: started, pid: {os.getpid()}, processes: {len(workers)}, seconds: {time.monotonic() - started:.1f}"
+        )
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # processes inherited from a parent are not this process's
+            self._pid = os.getpid()
+            self._idle = []
+            self._slots = threading.BoundedSemaphore(self.size)
+            if self._context is None:
+                self._context = multiprocessing.get_context('forkserver')
+                self._context.set_forkserver_preload(PRELOAD)
+        logger.info(f"geo pool: starting, pid: {os.getpid()}, size: {self.size}")
+
+    def _checkout(self, timeout):
+        self._ensure_started()
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("no geo pool process became free")
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+        if worker is not None and not worker.process.is_alive():
+            worker.close()
+            worker = None
+        if worker is None:
+            try:
+                worker = Worker(self._context)
+            except BaseException:
+                self._slots.release()
+                raise
+        return worker
+
+    def _checkin(self, worker):
+        worker.tasks += 1
+        if worker.tasks >= self.max_tasks:
+            worker.close()
+            self._count('recycled')
+        else:
+            with self._lock:
+                self._idle.append(worker)
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'enabled': self.enabled,
+                'size': self.size,
+                'idle': len(self._idle) if self._pid == os.getpid() else 0,
+                **self._stats,
+            }
+
+
+pool = GeoPool()
+
+
+@geo_pool_bp.route('/geo_pool_stats', methods=['GET'])
+@login_required
+def geo_pool_stats():
+    return jsonify(pool.snapshot())
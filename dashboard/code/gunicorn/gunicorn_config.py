@@ -0,0 +1,40 @@
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:80')
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+# gevent workers serve many connections each, which the /events streams
+# need, as each is held open for up to EVENTS_MAX_DURATION, see events.py
+worker_class = 'gevent'
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """Wait for psycopg2 through gevent, so a query only blocks the greenlet
+    running it rather than the whole worker, with its /events streams."""
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import extensions, OperationalError
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state}")
+
+
+def post_fork(server, worker):
+    # before the worker loads the app, so every connection it opens, the
+    # change feed's included, is cooperative
+    from psycopg2 import extensions
+    extensions.set_wait_callback(gevent_wait_callback)
+
+
+def post_worker_init(worker):
+    # the geo pool's processes are started before the worker takes
+    # requests, so the first upload does not wait for them
+    from geo_pool import pool
+    pool.start()
@@ -1,4 +1,4 @@
-from sqlalchemy import func
+from sqlalchemy import func, text
 from uuid import uuid4, UUID
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID, ARRAY
 from geoalchemy2 import Geometry
@@ -19,6 +19,10 @@ class Objects(db.Model):
     owner = db.Column(db.String(), nullable=False)
     gis = db.Column(db.Boolean, default=False)
     spatial_extents = db.Column(Geometry("GEOMETRY", srid=4326), nullable=True)
+    # dissolved footprints, cheapest first, see geo_ingestion.footprints
+    footprint_hull = db.Column(Geometry("GEOMETRY", srid=4326), nullable=True)
+    footprint_coarse = db.Column(Geometry("GEOMETRY", srid=4326), nullable=True)
+    footprint_fine = db.Column(Geometry("GEOMETRY", srid=4326), nullable=True)
     size = db.Column(db.Integer, nullable=False)
     tags = db.Column(ARRAY(db.String), nullable=True)
     record_insert_time = db.Column(db.DateTime, default=func.now(), nullable=False)
@@ -28,6 +32,35 @@ class Objects(db.Model):
     deletion_time = db.Column(db.DateTime, nullable=True)
     clamav_scan = db.Column(db.String(), nullable=True)
 
+    # keyset paging of a catalogue item's active files, see queries.page
+    __table_args__ = (
+        db.Index(
+            'ix_object_store_metadata_catalogue_time',
+            'data_dict_uuid', 'record_insert_time', 'uuid',
+            postgresql_where=text("status = 'active'")
+        ),
+        db.Index(
+            'ix_object_store_metadata_catalogue_filename',
+            'data_dict_uuid', 'filename', 'uuid',
+            postgresql_where=text("status = 'active'")
+        ),
+    )
+
+
+class Layers(db.Model):
+    # the layers of an object with several, e.g. a GeoPackage, see
+    # geo_ingestion.extract
+    __tablename__ = 'object_layers'
+    object_uuid = db.Column(
+        PG_UUID(as_uuid=True), db.ForeignKey('object_store_metadata.uuid', ondelete='CASCADE'),
+        nullable=False, primary_key=True
+    )
+    name = db.Column(db.String(), nullable=False, primary_key=True)
+    geometry_type = db.Column(db.String(), nullable=True)
+    feature_count = db.Column(db.Integer, nullable=True)
+    source_crs = db.Column(db.String(), nullable=True)
+    spatial_extents = db.Column(Geometry("GEOMETRY", srid=4326), nullable=True)
+
 
 class DataDict(db.Model):
     __tablename__ = 'model_data_dictionary'
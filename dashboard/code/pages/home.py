@@ -2,6 +2,9 @@ import dash
 from dash import dcc, html
 import dash_bootstrap_components as dbc
 
+import figures
+import queries
+
 dash.register_page(__name__)
 
 layout = html.Div([
@@ -35,6 +38,15 @@ layout = html.Div([
                     color='primary',
                     size='lg',
                   ),
+                  dbc.Button(
+                    'Spatial search',
+                    id='spatial-search-button',
+                    n_clicks=0,
+                    className='me-1',
+                    outline=True,
+                    color='primary',
+                    size='lg',
+                  ),
                 ]),
               ], style={'text-align': 'right'})
             ], width=6),
@@ -129,6 +141,27 @@ layout = html.Div([
             ], xs=12, sm=12, md=4, lg=4, xl=4),
           ]),
           html.Br(),
+          dbc.Row([
+            dbc.Col([
+              html.H5("Full-text search (catalogue items and files)"),
+              dbc.InputGroup([
+                dbc.Input(
+                  id="text-search-input",
+                  type='text',
+                  size="lg",
+                  debounce=True,
+                ),
+                dbc.Button(
+                  'Search',
+                  id='text-search-submit',
+                  n_clicks=0,
+                  outline=True,
+                  color='primary',
+                ),
+              ]),
+            ], width=12),
+          ]),
+          html.Br(),
           html.Br(),
           dbc.Row([
             html.Div([
@@ -138,7 +171,10 @@ layout = html.Div([
           html.Hr(),
           dbc.Row([
             dcc.Loading([
-              html.Div(id='data_dict_datatable'),
+              html.Div(
+                id='data_dict_datatable',
+                children=figures.dataDictTable(queries.CATALOGUE_COLUMNS)
+              ),
               ],
               overlay_style={"visibility": "visible", "filter": "blur(2px)"},
             )
@@ -411,6 +447,75 @@ layout = html.Div([
       is_open=False,
       size='xl'
     ),
+    dbc.Modal([
+      dbc.ModalHeader(
+        html.H2(id='spatial-search-title', children='Spatial Search: 0'),
+        close_button=True
+      ),
+      dbc.ModalBody([
+        dbc.Row([
+          dbc.Col([
+            html.H5("Draw a box or lasso on the map, or enter a bounding box"),
+            dbc.InputGroup([
+              dbc.Input(
+                id='spatial-search-bbox',
+                placeholder="min lon, min lat, max lon, max lat",
+                type='text',
+                size="lg",
+              ),
+              dbc.Button(
+                'Search',
+                id='spatial-search-submit',
+                n_clicks=0,
+                outline=True,
+                color='primary',
+              ),
+            ]),
+            dbc.Alert(
+              id='spatial-search-alert',
+              color='warning',
+              is_open=False,
+              dismissable=True,
+            ),
+            html.Hr(),
+            dcc.Loading([
+              html.Div(id='spatial-search-table-location'),
+            ], overlay_style={"visibility": "visible", "filter": "blur(2px)"}),
+          ], width=6),
+          dbc.Col([
+            html.Div(children=[
+              dcc.Graph(
+                id='spatial-search-map',
+                config={'scrollZoom': True},
+                style={'height': '600px'}
+              )
+            ], className='map'),
+          ], width=6),
+        ]),
+      ]),
+    ],
+      id="spatial-search-modal",
+      size="xl",
+      is_open=False,
+      centered=True,
+    ),
+    dbc.Modal([
+      dbc.ModalHeader(
+        html.H2(id='text-search-title', children='Search Results: 0'),
+        close_button=True
+      ),
+      dbc.ModalBody([
+        dcc.Loading([
+          html.Div(id='text-search-table-location'),
+        ], overlay_style={"visibility": "visible", "filter": "blur(2px)"}),
+      ]),
+    ],
+      id="text-search-modal",
+      size="xl",
+      is_open=False,
+      centered=True,
+      scrollable=True,
+    ),
     dbc.Modal([
       dbc.ModalHeader(html.H2(
           "Help"
@@ -483,6 +588,29 @@ layout = html.Div([
     html.Div(id="dummy-output", style={"display": "none"}),
     html.Div(id="log-output", style={"display": "none"}),
     dcc.Store(id="download-url", data=""),
+    # every catalogue item, kept for the browser session and only replaced
+    # when its ETag changes, see load_catalogue
+    dcc.Store(id="catalogue-store", storage_type='session'),
+    dcc.Store(id="catalogue-etag", storage_type='session'),
+    # filters, total and keyset paging position of the server-side tables
+    dcc.Store(id="associated-files-state"),
+    dcc.Store(id="spatial-search-state"),
+    dcc.Store(id="text-search-state"),
+    # the selected associated files of every page, in the order they were
+    # selected, see selectedFiles in assets/ui.js
+    dcc.Store(id="associated-files-selected"),
+    # the last committed upload or delete, set by handle_upload and
+    # delete_files
+    dcc.Store(id="objects-change"),
+    # change events pushed from /events by assets/events.js, and those of
+    # other users to the selected catalogue item's files
+    dcc.Store(id="server-events"),
+    dcc.Store(id="files-event"),
+    dcc.Store(id="catalogue-change"),
+    # name and bounds of each file on the Map, in the order of the features
+    # of the footprints trace (figures.FOOTPRINTS_TRACE), so render_map can
+    # patch the figure
+    dcc.Store(id="map-traces"),
     dcc.Interval(
       id='interval_pg',
       interval=1000,
@@ -0,0 +1,334 @@
+import re
+import json
+import math
+import hashlib
+import logging
+from uuid import UUID
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import (
+    select, func, tuple_, cast, literal, literal_column, union_all, MetaData,
+    Table, Column, String, DateTime, Integer, BigInteger
+)
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, ARRAY
+from sqlalchemy.sql.selectable import Subquery
+
+from models import Objects, DataDict
+from query_cache import cache
+import utils
+
+logger = logging.getLogger(__name__)
+
+# Tables which are not mapped on the models because they are created by
+# schema.DDL. Kept out of db.metadata so that create_all leaves them alone
+views = MetaData()
+
+catalogue_summary = Table(
+    'catalogue_summary', views,
+    Column('data_dict_uuid', PG_UUID(as_uuid=True), primary_key=True),
+    Column('file_count', BigInteger),
+    Column('total_size', BigInteger),
+    Column('latest_upload', DateTime),
+    Column('owner_count', BigInteger),
+)
+
+SUMMARY_COLUMNS = [
+    func.coalesce(catalogue_summary.c.file_count, 0).label('file_count'),
+    func.coalesce(catalogue_summary.c.total_size, 0).label('total_size'),
+    func.coalesce(catalogue_summary.c.owner_count, 0).label('owner_count'),
+    # items without files count as active when they were catalogued
+    func.coalesce(
+        catalogue_summary.c.latest_upload, DataDict.record_insert_time
+    ).label('last_activity'),
+]
+
+# Paging is done with a seek on (sort column, uuid), so only NOT NULL
+# columns can be sorted on. Sorting on any other column falls back to the
+# default order
+OBJECTS_SORTABLE = {
+    name: Objects.__table__.c[name] for name in (
+        'filename', 'owner', 'size', 'filename_extension',
+        'record_insert_time', 'uuid'
+    )
+}
+
+# geometry columns, which the tables never show or filter on
+GEOMETRY_COLUMNS = ['spatial_extents', 'footprint_hull', 'footprint_coarse', 'footprint_fine']
+OBJECT_COLUMNS = [c for c in Objects.__table__.c if c.name not in GEOMETRY_COLUMNS]
+
+FILTER_OPERATORS = [
+    ['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='],
+    ['eq ', '='], ['contains '], ['datestartswith '],
+]
+
+
+CATALOGUE_COLUMNS = [c.name for c in DataDict.__table__.c] + [c.name for c in SUMMARY_COLUMNS]
+
+# kept as lists in the catalogue sent to the browser, which filters on them
+CATALOGUE_ARRAY_COLUMNS = [
+    c.name for c in DataDict.__table__.c if isinstance(c.type, ARRAY)
+]
+
+
+def catalogue_query():
+    return (
+        select(DataDict, *SUMMARY_COLUMNS)
+        .outerjoin(
+            catalogue_summary,
+            catalogue_summary.c.data_dict_uuid == DataDict.uuid
+        )
+        .where(DataDict.filename_extensions.isnot(None))
+        .where(DataDict.mime_types.isnot(None))
+        .order_by(DataDict.name, DataDict.uuid)
+    )
+
+
+def catalogue():
+    """Every catalogue item as JSON-compatible records, and an ETag of them.
+    Cached until the catalogue or its summary changes."""
+    q = catalogue_query()
+
+    def compute(engine):
+        df = pd.read_sql_query(sql=q, con=engine)
+        records, _ = utils.serialize_frame(df.drop(columns=CATALOGUE_ARRAY_COLUMNS))
+        arrays = df[CATALOGUE_ARRAY_COLUMNS].to_dict('records')
+        for record, row in zip(records, arrays):
+            record.update(row)
+        etag = hashlib.sha1(json.dumps(records, sort_keys=True).encode()).hexdigest()
+        return etag, records
+
+    return cache.cached('catalogue', 'catalogue', q, compute)
+
+
+def objects_query(data_dict_uuid, filter_query=None):
+    q = (
+        select(*OBJECT_COLUMNS)
+        .where(Objects.data_dict_uuid == UUID(data_dict_uuid))
+        .where(Objects.status == 'active')
+    )
+    for part in (filter_query or '').split(' && '):
+        condition = table_filter(Objects, part)
+        if condition is not None:
+            q = q.where(condition)
+    return q
+
+
+def split_filter_part(filter_part):
+    """Split one clause of a DataTable filter_query into (column, operator,
+    value)."""
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+                return name, operator_type[0].strip(), value
+    return None, None, None
+
+
+def table_filter(model, filter_part):
+    column, operator, value = split_filter_part(filter_part)
+    if column is None or column not in model.__table__.c or column in GEOMETRY_COLUMNS:
+        return None
+    col = model.__table__.c[column]
+    if operator == 'contains':
+        return cast(col, String).icontains(str(value), autoescape=True)
+    if operator == 'datestartswith':
+        return cast(col, String).startswith(str(value), autoescape=True)
+    if not isinstance(col.type, Integer):
+        col, value = cast(col, String), str(value)
+    return {
+        'ge': col >= value, 'le': col <= value, 'lt': col < value,
+        'gt': col > value, 'ne': col != value, 'eq': col == value,
+    }[operator]
+
+
+def footprint(column):
+    """An object's footprint at the level of a footprint column of Objects,
+    or its bounding box for objects ingested before footprints were."""
+    return func.coalesce(getattr(Objects, column), Objects.spatial_extents)
+
+
+def spatial_search_query(wkt):
+    """Active objects whose footprints intersect a geometry, largest overlap
+    first. Candidates are found from the GiST index on spatial_extents, then
+    checked against footprint_fine."""
+    geom = func.ST_MakeValid(func.ST_GeomFromText(wkt, 4326))
+    overlap = func.ST_Area(func.ST_Intersection(footprint('footprint_fine'), geom))
+    return (
+        select(
+            Objects.filename,
+            DataDict.name.label('catalogue_item'),
+            overlap.label('overlap'),
+            Objects.owner,
+            Objects.size,
+            Objects.record_insert_time,
+            Objects.uuid,
+            Objects.data_dict_uuid,
+        )
+        .join(DataDict, DataDict.uuid == Objects.data_dict_uuid, isouter=True)
+        .where(Objects.status == 'active')
+        .where(func.ST_Intersects(Objects.spatial_extents, geom))
+        .where(func.ST_Intersects(footprint('footprint_fine'), geom))
+        .order_by(overlap.desc(), Objects.uuid)
+    )
+
+
+def prefix_tsquery(text):
+    """Turn free text into a tsquery which matches every word as a prefix,
+    or None if there are no words."""
+    # underscores split words, as they do in the indexed filenames
+    words = re.findall(r'[^\W_]+', text.lower())[:10]
+    return ' & '.join(f"{w}:*" for w in words) or None
+
+
+def text_search_query(tsquery):
+    """Catalogue items and active files matching a tsquery, best match
+    first. Both halves are answered from the GIN indexes on the generated
+    search_vector columns created by schema.DDL."""
+    query = func.to_tsquery('english', tsquery)
+    datadict_vector = literal_column('model_data_dictionary.search_vector')
+    objects_vector = literal_column('object_store_metadata.search_vector')
+    items = (
+        select(
+            literal('catalogue item').label('type'),
+            DataDict.name.label('name'),
+            func.ts_rank(datadict_vector, query).label('rank'),
+            (DataDict.description + ' ' + DataDict.notes).label('document'),
+            DataDict.uuid.label('uuid'),
+            DataDict.uuid.label('data_dict_uuid'),
+        )
+        .select_from(DataDict)
+        .where(datadict_vector.op('@@')(query))
+    )
+    files = (
+        select(
+            literal('file').label('type'),
+            Objects.filename.label('name'),
+            func.ts_rank(objects_vector, query).label('rank'),
+            func.coalesce(Objects.description, Objects.filename).label('document'),
+            Objects.uuid.label('uuid'),
+            Objects.data_dict_uuid.label('data_dict_uuid'),
+        )
+        .select_from(Objects)
+        .where(Objects.status == 'active')
+        .where(objects_vector.op('@@')(query))
+    )
+    return union_all(items, files).subquery()
+
+
+def text_search(tsquery, page_current, page_size, site='text_search'):
+    """One page of text_search_query with highlighted snippets. Snippets are
+    only generated for the rows on the page."""
+    matches = text_search_query(tsquery)
+    ranked = (
+        select(matches)
+        .order_by(matches.c.rank.desc(), matches.c.uuid)
+        .offset((page_current or 0) * page_size)
+        .limit(page_size)
+        .subquery()
+    )
+    q = select(
+        ranked.c.type,
+        ranked.c.name,
+        func.ts_headline(
+            'english', ranked.c.document, func.to_tsquery('english', tsquery),
+            'StartSel=**, StopSel=**, MaxWords=25, MinWords=8'
+        ).label('snippet'),
+        ranked.c.rank,
+        ranked.c.uuid,
+        ranked.c.data_dict_uuid,
+    ).order_by(ranked.c.rank.desc(), ranked.c.uuid)
+    return cache.read_sql(site, q)
+
+
+def offset_page(q, page_current, page_size, site='offset_page'):
+    q = q.offset((page_current or 0) * page_size).limit(page_size)
+    return cache.read_sql(site, q)
+
+
+def count(q, site='count'):
+    if not isinstance(q, Subquery):
+        q = q.order_by(None).subquery()
+    return cache.scalar(site, select(func.count()).select_from(q))
+
+
+def page_count(total, page_size):
+    return max(1, math.ceil(total / page_size))
+
+
+def page(q, columns, default_sort, sort_by, page_current, page_size, state=None, site='page'):
+    """Return one page of q as a DataFrame, and the paging state to pass back
+    in with the request for the next page. columns maps the names of the
+    sortable columns of q to their expressions, and must include 'uuid'.
+
+    Moving one page forward or back seeks from the first or last key of the
+    previous page, so the cost does not grow with the page number. Jumps to
+    other pages, or a changed sort, fall back to OFFSET.
+    """
+    if sort_by and sort_by[0]['column_id'] in columns:
+        sort = [sort_by[0]['column_id'], sort_by[0]['direction']]
+    else:
+        sort = [default_sort, 'asc']
+    col = columns[sort[0]]
+    uuid_col = columns['uuid']
+    desc = sort[1] == 'desc'
+    key = tuple_(col, uuid_col)
+    page_current = page_current or 0
+
+    reverse = False
+    seek = state and state.get('sort') == sort and state.get('first')
+    if seek and page_current == state['page'] + 1:
+        last = _key_params(col, state['last'])
+        q = q.where(key < last if desc else key > last)
+    elif seek and page_current == state['page'] - 1:
+        first = _key_params(col, state['first'])
+        q = q.where(key > first if desc else key < first)
+        reverse = True
+    elif seek and page_current == state['page']:
+        first = _key_params(col, state['first'])
+        q = q.where(key <= first if desc else key >= first)
+    elif page_current > 0:
+        q = q.offset(page_current * page_size)
+
+    if desc != reverse:
+        q = q.order_by(col.desc(), uuid_col.desc())
+    else:
+        q = q.order_by(col.asc(), uuid_col.asc())
+    q = q.limit(page_size)
+
+    df = cache.read_sql(site, q)
+    if reverse:
+        df = df.iloc[::-1].reset_index(drop=True)
+
+    state = {'page': page_current, 'sort': sort, 'first': None, 'last': None}
+    if not df.empty:
+        state['first'] = [_key_value(df[sort[0]].iloc[0]), str(df['uuid'].iloc[0])]
+        state['last'] = [_key_value(df[sort[0]].iloc[-1]), str(df['uuid'].iloc[-1])]
+    return df, state
+
+
+def _key_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _key_params(col, key):
+    column_type = col.type
+    value, uuid = key
+    if isinstance(column_type, DateTime):
+        value = datetime.fromisoformat(value)
+    elif isinstance(column_type, PG_UUID):
+        value = UUID(value)
+    return value, UUID(uuid)
@@ -0,0 +1,349 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+import pandas as pd
+from flask import Blueprint, jsonify
+from flask_login import login_required
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.util import find_tables
+
+from extensions import db, change_feed
+import db_routing
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+query_cache_bp = Blueprint('query_cache', __name__)
+
+COUNTERS = ('hits', 'shared_hits', 'misses', 'waits', 'bypasses', 'errors')
+
+
+class MemoryBackend:
+    """In-process stand-in for a shared backend, for development without
+    Redis. Only shared by the threads of one worker. Holds at most size
+    values, evicting the least recently used, and drops expired values as
+    it finds them."""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+        # version counters and locks, a few per table, kept apart so they
+        # are never evicted by values
+        self._counters = {}
+        self._locks = {}
+
+    def get(self, key):
+        with self._lock:
+            expires, value = self._values.get(key, (None, None))
+            if expires is None:
+                return None
+            if expires < time.monotonic():
+                del self._values[key]
+                return None
+            self._values.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._values[key] = (now + ttl, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+            # the least recently used values are the likeliest to have
+            # expired
+            while self._values:
+                oldest = next(iter(self._values))
+                if self._values[oldest][0] >= now:
+                    break
+                del self._values[oldest]
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._counters.get(key) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def lock(self, key, ttl):
+        with self._lock:
+            expires = self._locks.get(key)
+            if expires is not None and expires >= time.monotonic():
+                return False
+            self._locks[key] = time.monotonic() + ttl
+            return True
+
+    def unlock(self, key):
+        with self._lock:
+            self._locks.pop(key, None)
+
+
+class RedisBackend:
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("QUERY_CACHE_BACKEND is a Redis URL but redis is not installed")
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=max(1, int(ttl)))
+
+    def mget(self, keys):
+        return self._client.mget(keys)
+
+    def incr(self, key):
+        self._client.incr(key)
+
+    def lock(self, key, ttl):
+        return bool(self._client.set(key, 1, nx=True, ex=max(1, int(ttl))))
+
+    def unlock(self, key):
+        self._client.delete(key)
+
+
+class QueryCache:
+    """Caches the results of read queries per worker, and optionally in a
+    backend shared by all workers, keyed by SQL and parameters.
+
+    An entry stores the versions of the tables it read and is stale once any
+    of them has changed: the change feed versions for this worker's cache,
+    and counters in the backend, incremented from every worker's change
+    feed, for the shared one. The cache is bypassed while the change feed is
+    disconnected and while a user's reads are pinned to the primary after a
+    write, since neither set of versions can be trusted then.
+
+    A result cached under a version must include the change which produced
+    that version, so misses run on a replica only if it had replayed every
+    change to the tables read which this worker has seen, and otherwise on
+    the primary. Soon after a change, misses therefore go to the primary
+    until the replicas' lag is next checked, see db_routing.read_engine.
+    Concurrent misses for the same key wait for the first one instead of
+    running the query again.
+
+    config_prefix names the app config keys read by init_app, so a cache
+    for one kind of result can be sized separately, e.g. tiles.py.
+    """
+
+    def __init__(self, config_prefix='QUERY_CACHE'):
+        self.config_prefix = config_prefix
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._stats = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        self._pid = None
+        self.enabled = False
+        self.backend = None
+
+    def init_app(self, app):
+        config = {
+            name: app.config[f"{self.config_prefix}_{name}"]
+            for name in ('ENABLED', 'SIZE', 'TTL', 'WAIT', 'BACKEND')
+        }
+        self.enabled = config['ENABLED']
+        self.size = config['SIZE']
+        self.ttl = config['TTL']
+        self.wait = config['WAIT']
+        backend = config['BACKEND']
+        if backend == 'memory':
+            self.backend = MemoryBackend(self.size)
+        elif backend:
+            self.backend = RedisBackend(backend)
+
+    def read_sql(self, site, q):
+        """pd.read_sql_query(q) through the cache."""
+        return self.cached(
+            site, 'read_sql', q, lambda engine: pd.read_sql_query(sql=q, con=engine)
+        ).copy(deep=False)
+
+    def read_table(self, site, table):
+        """pd.read_sql_table(table) through the cache."""
+        q = select(db.metadata.tables[table])
+        return self.cached(
+            site, 'read_table', q, lambda engine: pd.read_sql_table(table, con=engine)
+        ).copy(deep=False)
+
+    def scalar(self, site, q):
+        def compute(engine):
+            with engine.connect() as conn:
+                return conn.execute(q).scalar()
+        return self.cached(site, 'scalar', q, compute)
+
+    def cached(self, site, kind, q, compute):
+        """Return compute(engine) for the statement q, from the cache if it
+        has a current result. kind tells apart the results of different
+        computes on the same statement, and site names the caller in the
+        stats."""
+        if self.enabled:
+            # so the cache does not depend on something else having started
+            # the feed in this worker
+            change_feed.start()
+        if not self.enabled or not change_feed.connected or db_routing.pinned_to_primary():
+            self._count(site, 'bypasses')
+            return compute(db_routing.read_engine())
+        self._ensure_subscribed()
+
+        key = _key(kind, q)
+        tables = sorted({t.name for t in find_tables(q)})
+
+        while True:
+            versions = tuple(change_feed.version(t) for t in tables)
+            # read after the versions, so it covers every change they count
+            changed_at = change_feed.changed_at(tables)
+            value = self._get_local(key, versions)
+            if value is not None:
+                self._count(site, 'hits')
+                return value
+            with self._lock:
+                inflight = self._inflight.get(key)
+                if inflight is None:
+                    inflight = self._inflight[key] = threading.Event()
+                    break
+            # another thread is running this query
+            self._count(site, 'waits')
+            if not inflight.wait(self.wait):
+                # run it here as well rather than wait any longer
+                inflight = None
+                break
+
+        def run():
+            return compute(db_routing.read_engine(changed_at))
+
+        try:
+            if self.backend is not None:
+                value = self._shared(site, key, tables, run)
+            else:
+                value = run()
+                self._count(site, 'misses')
+            self._set_local(key, versions, value)
+            return value
+        finally:
+            if inflight is not None:
+                with self._lock:
+                    del self._inflight[key]
+                inflight.set()
+
+    def _get_local(self, key, versions):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, entry_versions, value = entry
+            if expires < now or entry_versions != versions:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key, versions, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _shared(self, site, key, tables, compute):
+        # a shared entry is stored with the backend's versions of its tables
+        # when the query started, so a change during the query makes it stale
+        locked = False
+        try:
+            versions = self._shared_versions(tables)
+            deadline = time.monotonic() + self.wait
+            while True:
+                stored = self.backend.get(f"qc:{key}")
+                if stored is not None:
+                    stored_versions, value = pickle.loads(stored)
+                    if stored_versions == versions:
+                        self._count(site, 'shared_hits')
+                        return value
+                locked = self.backend.lock(f"qc:lock:{key}", self.wait)
+                if locked or time.monotonic() > deadline:
+                    break
+                # another worker is running this query
+                time.sleep(0.05)
+        except Exception as e:
+            self._count(site, 'errors')
+            logger.warning(f"query cache: shared backend exception, site: {site}, exception: {e}")
+            self._count(site, 'misses')
+            return compute()
+
+        self._count(site, 'misses')
+        value = compute()
+        try:
+            self.backend.set(f"qc:{key}", pickle.dumps((versions, value)), self.ttl)
+            if locked:
+                self.backend.unlock(f"qc:lock:{key}")
+        except Exception as e:
+            self._count(site, 'errors')
+            logger.warning(f"query cache: shared backend exception, site: {site}, exception: {e}")
+        return value
+
+    def _shared_versions(self, tables):
+        return tuple(
+            int(v or 0) for v in self.backend.mget([f"qc:version:{t}" for t in tables])
+        )
+
+    def _ensure_subscribed(self):
+        if self.backend is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        change_feed.subscribe(self._on_change)
+
+    def _on_change(self, event):
+        # every worker increments the counter, which only has to change
+        if event.get('table'):
+            try:
+                self.backend.incr(f"qc:version:{event['table']}")
+            except Exception as e:
+                logger.warning(f"query cache: version increment exception, exception: {e}")
+
+    def _count(self, site, name):
+        with self._lock:
+            self._stats[site][name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            sites = {site: dict(counts) for site, counts in self._stats.items()}
+            entries = len(self._entries)
+        for counts in sites.values():
+            lookups = counts['hits'] + counts['shared_hits'] + counts['misses']
+            counts['hit_rate'] = round((counts['hits'] + counts['shared_hits']) / lookups, 3) if lookups else None
+        return {
+            'pid': os.getpid(),
+            'enabled': self.enabled,
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'entries': entries,
+            'sites': sites,
+        }
+
+
+cache = QueryCache()
+
+
+def _key(kind, q):
+    compiled = q.compile(dialect=postgresql.dialect())
+    params = sorted((k, repr(v)) for k, v in compiled.params.items())
+    return hashlib.sha256(f"{kind}\n{compiled}\n{params}".encode()).hexdigest()
+
+
+@query_cache_bp.route('/query_cache_stats', methods=['GET'])
+@login_required
+def query_cache_stats():
+    return jsonify(cache.snapshot())
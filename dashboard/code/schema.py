@@ -0,0 +1,95 @@
+import logging
+from sqlalchemy import text
+
+from extensions import db
+import change_feed
+
+logger = logging.getLogger(__name__)
+
+# Tables added to the models after the database was created
+TABLES = ['object_layers']
+
+# Columns added to the models after their tables were created, which
+# create_all does not add to an existing table. Run before the indexes on
+# them are created
+COLUMNS = [
+    f"ALTER TABLE object_store_metadata ADD COLUMN IF NOT EXISTS {column} geometry(GEOMETRY, 4326)"
+    for column in ('footprint_hull', 'footprint_coarse', 'footprint_fine')
+]
+
+# Statements which cannot be declared on the models. Each must be safe to run
+# again on a database which already has it
+DDL = [
+    # full-text search, see queries.text_search
+    """
+    ALTER TABLE model_data_dictionary ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(notes, '') || ' ' || coalesce(reference_documentation, '')), 'C')
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_model_data_dictionary_search
+    ON model_data_dictionary USING gin (search_vector)
+    """,
+    # underscores and dots are replaced so that the parts of a filename are
+    # indexed as separate words
+    r"""
+    ALTER TABLE object_store_metadata ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', regexp_replace(coalesce(filename, ''), '[_.\-]+', ' ', 'g')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_object_store_metadata_search
+    ON object_store_metadata USING gin (search_vector) WHERE status = 'active'
+    """,
+    # per catalogue item totals, joined into the catalogue table. Refreshed
+    # by db_actions.refresh_catalogue_summary after uploads and deletes
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS catalogue_summary AS
+    SELECT
+        data_dict_uuid,
+        count(*) AS file_count,
+        sum(size) AS total_size,
+        max(record_insert_time) AS latest_upload,
+        count(DISTINCT owner) AS owner_count
+    FROM object_store_metadata
+    WHERE status = 'active'
+    GROUP BY data_dict_uuid
+    """,
+    # REFRESH ... CONCURRENTLY requires a unique index
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_catalogue_summary_data_dict_uuid
+    ON catalogue_summary (data_dict_uuid)
+    """,
+    # the catalogue is read whole into the browser rather than paged by
+    # (name, uuid), which this index backed
+    "DROP INDEX IF EXISTS ix_model_data_dictionary_name",
+] + change_feed.DDL
+
+
+def apply_schema():
+    """Add TABLES and COLUMNS, and create the indexes declared on the
+    models and the objects in DDL, on an existing database."""
+    db.metadata.create_all(db.engine, tables=[db.metadata.tables[t] for t in TABLES])
+    with db.engine.begin() as conn:
+        for statement in COLUMNS:
+            conn.execute(text(statement))
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+            logger.info(f"apply_schema: index present, index: {index.name}")
+    with db.engine.begin() as conn:
+        for statement in DDL:
+            conn.execute(text(statement))
+    logger.info(f"apply_schema: applied {len(DDL)} statements")
+
+
+def register_commands(app):
+    @app.cli.command('apply-schema')
+    def apply_schema_command():
+        """Create missing tables, columns, indexes, views and triggers."""
+        apply_schema()
@@ -0,0 +1,103 @@
+import uuid
+import logging
+from flask import Blueprint, Response, abort, request
+from flask_login import login_required, current_user
+from sqlalchemy import select, func, cast, String, LargeBinary
+
+from models import Objects
+import queries
+from query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+tiles_bp = Blueprint('tiles', __name__)
+
+# tiles are cached like query results, keyed by their SQL and so by the
+# tile and filters, and are stale once object_store_metadata changes
+cache = QueryCache('TILE_CACHE')
+
+LAYER = 'footprints'
+TILE_EXTENT = 4096
+# pixels around the tile, in TILE_EXTENT units, so outlines are not cut at
+# tile edges
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+# latitude of the edges of Web Mercator, which is undefined at the poles.
+# Footprints are clipped to it, as a global dataset, or a footprint grown
+# by geo_ingestion.dissolve, can reach or pass them
+MERCATOR_MAX_LATITUDE = 85.0511287798066
+STATUSES = ('active', 'deleted')
+# footprint column drawn up to each zoom, see geo_ingestion.footprints
+ZOOM_FOOTPRINTS = [(5, 'footprint_hull'), (9, 'footprint_coarse'), (MAX_ZOOM, 'footprint_fine')]
+
+
+def zoom_footprint(z):
+    return next(column for max_zoom, column in ZOOM_FOOTPRINTS if z <= max_zoom)
+
+
+def tile_query(z, x, y, status, data_dict_uuid=None):
+    """ST_AsMVT of the footprints of the objects with a status, and of one
+    catalogue item if given, which intersect tile z/x/y, at the level of
+    detail for z. The tile envelope is brought to 4326 for the filter, so it
+    is answered from the GiST index on spatial_extents."""
+    envelope = func.ST_TileEnvelope(z, x, y)
+    mercator = func.ST_MakeEnvelope(
+        -180, -MERCATOR_MAX_LATITUDE, 180, MERCATOR_MAX_LATITUDE, 4326
+    )
+    footprint = func.ST_ClipByBox2D(queries.footprint(zoom_footprint(z)), mercator)
+    rows = (
+        select(
+            func.ST_AsMVTGeom(
+                func.ST_Transform(footprint, 3857),
+                envelope, TILE_EXTENT, TILE_BUFFER, True
+            ).label('geom'),
+            cast(Objects.uuid, String).label('uuid'),
+            Objects.filename,
+            cast(Objects.data_dict_uuid, String).label('data_dict_uuid'),
+        )
+        .where(Objects.status == status)
+        .where(func.ST_Intersects(
+            Objects.spatial_extents, func.ST_Transform(envelope, 4326)
+        ))
+    )
+    if data_dict_uuid is not None:
+        rows = rows.where(Objects.data_dict_uuid == data_dict_uuid)
+    tile = rows.subquery('tile')
+    # typed, so the tile is read as bytes rather than a memoryview, which
+    # could not be pickled into a shared cache backend
+    return select(func.ST_AsMVT(
+        tile.table_valued(), LAYER, TILE_EXTENT, 'geom', type_=LargeBinary
+    ))
+
+
+@tiles_bp.route('/tiles/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+@login_required
+def tiles(z, x, y):
+    """Mapbox vector tile of object footprints, one layer named LAYER with
+    the uuid, filename and data_dict_uuid of each object. Query parameters:
+    status (default active) and data_dict_uuid to show one catalogue item."""
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        abort(404)
+    status = request.args.get('status', 'active')
+    if status not in STATUSES:
+        abort(400, description=f"status must be one of {', '.join(STATUSES)}")
+    data_dict_uuid = request.args.get('data_dict_uuid')
+    if data_dict_uuid is not None:
+        try:
+            data_dict_uuid = uuid.UUID(data_dict_uuid)
+        except ValueError:
+            abort(400, description="data_dict_uuid is not a UUID")
+
+    q = tile_query(z, x, y, status, data_dict_uuid)
+    try:
+        tile = cache.scalar('tiles', q)
+    except Exception as e:
+        logger.error(f"tiles: exception, user: {current_user.email}, tile: {z}/{x}/{y}, exception: {e}")
+        abort(500)
+
+    response = Response(bytes(tile or b''), mimetype='application/vnd.mapbox-vector-tile')
+    # the browser keeps the tile and asks whether it has changed, which is
+    # answered with a 304 from the cached tile
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
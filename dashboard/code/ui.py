@@ -0,0 +1,180 @@
+from dash import html, no_update
+
+from figures import TOOLTIP_MIN_LENGTH
+
+# Python versions of the clientside callbacks of assets/ui.js, which run in
+# the browser instead. They are not registered as callbacks; they are the
+# reference assets/ui.js is tested against in tests/test_ui.py, so a change
+# to one is made to both.
+
+
+def format_size(bytes):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB', 'PB']:
+        if bytes < 1024:
+            return f"{bytes:.2f} {unit}"
+        bytes /= 1024
+
+
+def selected_size(selected):
+    return sum(row['size'] for row in selected)
+
+
+def total_title(label, state):
+    return f"{label}: {state['total'] if state else 0}"
+
+
+def files_title(state):
+    return total_title('Associated Files', state)
+
+
+def spatial_search_title(state):
+    return total_title('Spatial Search', state)
+
+
+def text_search_title(state):
+    return total_title('Search Results', state)
+
+
+def download_title(selected):
+    if selected is None:
+        return no_update
+    return f"ℹ️ {len(selected)}"
+
+
+def selection_buttons(selected):
+    if not selected:
+        return True, True, True, 'secondary', 'secondary', 'secondary'
+    if len(selected) == 1:
+        return False, False, False, 'primary', 'primary', 'danger'
+    # only allow delete button for one file at a time
+    return False, False, True, 'primary', 'primary', 'secondary'
+
+
+def estimated_size(selected):
+    if selected is None:
+        return no_update
+    return f"Estimated size: {format_size(selected_size(selected))}"
+
+
+def download_button(selected):
+    count = len(selected) if selected else 0
+    if count > 10:
+        return "Download MAXIMUM EXCEEDED (10 Files)", True, "secondary"
+    if count > 0:
+        return f"Download ({format_size(selected_size(selected))})", False, "primary"
+    return "Download 0B", True, "secondary"
+
+
+def upload_name(filename):
+    if filename is not None:
+        return f"Selected: {filename}"
+    return html.Div([
+        'Drag and Drop or ',
+        html.A('Select Files')
+    ])
+
+
+def upload_button(filename, selected_rows):
+    if filename is not None and selected_rows:
+        return False, 'primary'
+    return True, 'secondary'
+
+
+def selected_files(selected_rows, data, selected):
+    # the selected files of every page, in the order they were selected
+    page = {row['uuid'] for row in data or []}
+    rows = [data[i] for i in selected_rows or []]
+    chosen = {row['uuid']: row for row in rows}
+    kept = [
+        chosen.get(row['uuid'], row) for row in selected or []
+        if row['uuid'] not in page or row['uuid'] in chosen
+    ]
+    before = {row['uuid'] for row in kept}
+    result = kept + [row for row in rows if row['uuid'] not in before]
+    if [row['uuid'] for row in result] == [row['uuid'] for row in selected or []]:
+        return no_update
+    return result
+
+
+def distinct(records, column, is_array):
+    values = set()
+    for record in records:
+        value = record.get(column)
+        if value is None:
+            continue
+        values.update(value if is_array else [value])
+    return sorted(values)
+
+
+def overlaps(values, selected):
+    return not selected or any(v in selected for v in values or [])
+
+
+def contains(value, text):
+    return not text or text.lower() in str(value).lower()
+
+
+def matches(record, f):
+    # substring matches on name and UUID, any of the selected values for
+    # the other filters
+    return (contains(record['name'], f['name'])
+            and contains(record['uuid'], f['uuid'])
+            and (not f['domain'] or record['model_domain'] in f['domain'])
+            and overlaps(record['filename_extensions'], f['extensions'])
+            and (not f['relation'] or record['relation_type'] in f['relation'])
+            and overlaps(record['produced_by'], f['produced_by'])
+            and overlaps(record['ingested_by'], f['ingested_by'])
+            and overlaps(record['modified_by'], f['modified_by'])
+            and (f['gis'] not in ('true', 'false') or record['gis'] == (f['gis'] == 'true')))
+
+
+def table_row(record, hidden):
+    row, tooltip = {}, {}
+    for column, value in record.items():
+        text = ', '.join(value) if isinstance(value, list) else value
+        row[column] = text
+        if column not in hidden and text is not None and len(str(text)) >= TOOLTIP_MIN_LENGTH:
+            tooltip[column] = {'value': str(text), 'type': 'text'}
+    return row, tooltip
+
+
+def catalogue_options(store):
+    records = store['records'] if store else []
+    return [
+        distinct(records, 'model_domain', False),
+        distinct(records, 'filename_extensions', True),
+        distinct(records, 'relation_type', False),
+        distinct(records, 'produced_by', True),
+        distinct(records, 'ingested_by', True),
+        distinct(records, 'modified_by', True),
+    ]
+
+
+def filter_catalogue(store, n, name, uuid, domain, extensions, relation,
+                     produced_by, ingested_by, modified_by, gis,
+                     hidden_columns, selected_rows, data):
+    filters = {
+        'name': name, 'uuid': uuid, 'domain': domain, 'extensions': extensions,
+        'relation': relation, 'produced_by': produced_by,
+        'ingested_by': ingested_by, 'modified_by': modified_by, 'gis': gis,
+    }
+    hidden = set(hidden_columns or [])
+    rows, tooltips = [], []
+    for record in (store['records'] if store else []):
+        if matches(record, filters):
+            row, tooltip = table_row(record, hidden)
+            rows.append(row)
+            tooltips.append(tooltip)
+
+    # keep the selected item selected if it is still shown
+    selected = []
+    if selected_rows and selected_rows[0] < len(data):
+        uuids = [row['uuid'] for row in rows]
+        if data[selected_rows[0]]['uuid'] in uuids:
+            selected = [uuids.index(data[selected_rows[0]]['uuid'])]
+    unchanged = selected == (selected_rows or [])
+    return rows, tooltips, no_update if unchanged else selected, f"Results: {len(rows)}"
+
+
+def show_help(n):
+    return True
@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 from uuid import uuid4, UUID
 from datetime import datetime
 import base64
@@ -12,8 +13,9 @@ from functools import wraps
 from flask_wtf.csrf import validate_csrf, CSRFError
 
 from geoalchemy2.elements import WKBElement
-from shapely.wkt import loads
+import shapely
 from shapely import wkb
+from shapely.geometry import box, Polygon
 
 from models import *
 
@@ -21,29 +23,98 @@ logger = logging.getLogger(__name__)
 
 clamd_client = clamd.ClamdNetworkSocket(host='clamav', port=3310, timeout=3600)
 
-def convert_value(val):
-    """Convert non-serializable values to JSON-compatible format."""
-    if isinstance(val, UUID):  # Convert UUID to string
-        return str(val)
-    elif isinstance(val, (np.integer, np.int64, np.int32)):  # Convert NumPy integers to Python int
-        return int(val)
-    elif isinstance(val, (np.floating, np.float64, np.float32)):  # Convert NumPy floats to Python float
-        return float(val)
-    elif isinstance(val, bytes):  # Convert bytes to string
-        return val.decode("utf-8")
-    elif isinstance(val, datetime):  # Convert datetime to string
-        return val.isoformat()
-    elif isinstance(val, WKBElement):  # Convert Geometry to WKT
-        return loads(val.data).wkt if val.data else None  # Extract WKT if exists
-    elif isinstance(val, list):
-        return ", ".join(val)
+# zips inflating by more than this, in all, are taken to be zip bombs.
+# Single members can inflate much further, e.g. a sparse .dbf
+ARCHIVE_MAX_RATIO = 100
+# zips inflating to less than this are not held to ARCHIVE_MAX_RATIO
+ARCHIVE_RATIO_MIN_SIZE = 2 ** 20  # bytes
+ARCHIVE_MAX_SIZE = 4 * 2 ** 30  # bytes, all members inflated
+ARCHIVE_MAX_MEMBERS = 256
+# never accepted, in an upload or in a zip, as a browser could run them
+DISALLOWED_EXTENSIONS = ('.html', '.js', '.htm', '.svg')
+
+
+class ArchiveRejected(ValueError):
+    """A zip which must not be stored, e.g. a zip bomb, as opposed to one
+    extents could not be read from."""
+
+def serialize_frame(df, tooltip_columns=(), tooltip_min_length=0):
+    """JSON-compatible records for a DataTable, and tooltips for the cells of
+    tooltip_columns at least tooltip_min_length characters long, in one
+    pass. Each column is converted once by its dtype rather than value by
+    value."""
+    columns = [str(c) for c in df.columns]
+    values = [_serialize_column(df[c]) for c in df.columns]
+    data = [dict(zip(columns, row)) for row in zip(*values)]
+
+    tooltips = []
+    for column, column_values in zip(columns, values):
+        if column not in tooltip_columns:
+            continue
+        text = ['' if v is None else str(v) for v in column_values]
+        if max(map(len, text), default=0) < max(tooltip_min_length, 1):
+            continue
+        tooltips.append((column, [
+            {'value': t, 'type': 'text'} if len(t) >= tooltip_min_length and t else None
+            for t in text
+        ]))
+    if not tooltips:
+        return data, []
+    tooltip_names = [column for column, _ in tooltips]
+    tooltip_data = [
+        {column: tip for column, tip in zip(tooltip_names, row) if tip is not None}
+        for row in zip(*(column_tooltips for _, column_tooltips in tooltips))
+    ]
+    return data, tooltip_data
+
+
+def _serialize_column(s):
+    """List of the JSON-compatible values of a column. Missing values become
+    None."""
+    missing = s.isna().to_numpy()
+    if pd.api.types.is_datetime64_dtype(s.dtype):
+        values = np.datetime_as_string(s.to_numpy(), unit='us').astype(object)
+    elif pd.api.types.is_bool_dtype(s.dtype) or pd.api.types.is_numeric_dtype(s.dtype):
+        # tolist gives Python ints and floats
+        values = np.array(s.tolist(), dtype=object)
     else:
-        return val
-
-
-def convert_record(record):
-    """Apply conversion function to each value in a record."""
-    return {k: convert_value(v) for k, v in record.items()}
+        values = s.to_numpy(dtype=object, copy=True)
+        present = values[~missing]
+        kinds = set(map(type, present))
+        if len(kinds) == 1:
+            values[~missing] = _serialize_objects(kinds.pop(), present)
+        elif kinds:
+            values[~missing] = [_serialize_objects(type(v), [v])[0] for v in present]
+    values[missing] = None
+    return values.tolist()
+
+
+def _serialize_objects(kind, values):
+    if issubclass(kind, str):
+        return values
+    if issubclass(kind, UUID):
+        return [str(v) for v in values]
+    if issubclass(kind, datetime):
+        return [v.isoformat() for v in values]
+    if issubclass(kind, list):
+        return [", ".join(map(str, v)) for v in values]
+    if issubclass(kind, bytes):
+        return [v.decode("utf-8") for v in values]
+    if issubclass(kind, WKBElement):
+        # parsed and written in bulk by shapely
+        return shapely.to_wkt(from_wkb_elements(values)).tolist()
+    if issubclass(kind, (np.integer, np.floating, np.bool_)):
+        return [v.item() for v in values]
+    return values
+
+
+def from_wkb_elements(values):
+    """Array of shapely geometries from GeoAlchemy WKBElements, parsed in
+    one call. None stays None."""
+    return shapely.from_wkb([
+        None if v is None else v.data if isinstance(v.data, str) else bytes(v.data)
+        for v in values
+    ])
 
 
 def decode_geometry(geom_bytes):
@@ -51,28 +122,16 @@ def decode_geometry(geom_bytes):
     return wkb.loads(geom_bytes, hex=True) if isinstance(geom_bytes, str) else wkb.loads(geom_bytes)
 
 
-def format_size(bytes):
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB', 'PB']:
-        if bytes < 1024:
-            return f"{bytes:.2f} {unit}"
-        bytes /= 1024
-
-
-def calculate_map_zoom_and_position(df):
-    all_lons = []
-    all_lats = []
-    for poly in df['polygon'].dropna():
-        lons, lats = poly.exterior.coords.xy
-        all_lons.extend(lons)
-        all_lats.extend(lats)
-
-    # Compute bounding box
-    min_lon, max_lon = min(all_lons), max(all_lons)
-    min_lat, max_lat = min(all_lats), max(all_lats)
+def calculate_map_zoom_and_position(bounds):
+    """Center and zoom of the map showing every (min_lon, min_lat, max_lon,
+    max_lat) in bounds."""
+    bounds = np.asarray(bounds, dtype=float)
+    min_lon, min_lat = bounds[:, :2].min(axis=0)
+    max_lon, max_lat = bounds[:, 2:].max(axis=0)
 
     # Calculate the center of the bounding box
-    lon = (min_lon + max_lon) / 2
-    lat = (min_lat + max_lat) / 2
+    lon = float(min_lon + max_lon) / 2
+    lat = float(min_lat + max_lat) / 2
 
     # A heuristic function to estimate the zoom level.
     # Note: This is a rough estimate and may need adjustment based on your data and map dimensions.
@@ -96,32 +155,50 @@ def calculate_map_zoom_and_position(df):
     return lat, lon, zoom
 
 
-def update_map_traces(df, current_figure):
-    new_names = []
-    for idx, row in df.iterrows():
-        new_names.append(row['filename'] + ' | ' + str(row['uuid']))
-
-    trace_names = []
-    traces_to_remove = []
-    for index, trace in enumerate(current_figure['data']):
-        if 'hovertext' in trace:
-            trace_name = trace['hovertext']
-            if trace_name not in new_names:
-                traces_to_remove.append(index)
-            else:
-                trace_names.append(trace_name)
-
-    for i in traces_to_remove:
-        current_figure['data'].pop(i)
-
-    return trace_names, current_figure
-
-
-def filter_df_list(df, column, value):
-    return df[df[column].apply(
-        lambda x: bool(set(x) & set(value))
-        if isinstance(x, (list, set)) else False
-    )]
+def update_map_traces(traces, names):
+    """Split the footprints on the map into those to keep, which are in
+    names, and the indexes of those to remove. traces are the entries of
+    the map-traces store, in the order of the footprints trace."""
+    kept = []
+    removed = []
+    for index, trace in enumerate(traces):
+        if trace['name'] in names:
+            kept.append(trace)
+        else:
+            removed.append(index)
+    return kept, removed
+
+
+def selected_rows(data, selected):
+    """Indexes of the rows of a page of data which are among the selected
+    rows, the entries of the associated-files-selected store."""
+    uuids = {row['uuid'] for row in selected or []}
+    return [i for i, row in enumerate(data) if row['uuid'] in uuids]
+
+
+def parse_bbox(text):
+    """Parse 'min_lon, min_lat, max_lon, max_lat' into a polygon."""
+    try:
+        minx, miny, maxx, maxy = [float(v) for v in text.replace(' ', '').split(',')]
+    except ValueError:
+        raise ValueError("Bounding box must be four numbers: min lon, min lat, max lon, max lat")
+    if not (-180 <= minx < maxx <= 180 and -90 <= miny < maxy <= 90):
+        raise ValueError("Bounding box must be in WGS84 degrees, with min before max")
+    return box(minx, miny, maxx, maxy)
+
+
+def selection_geometry(selected_data):
+    """Polygon of a box or lasso selection on a mapbox figure, or None."""
+    if not selected_data:
+        return None
+    if 'range' in selected_data and 'mapbox' in selected_data['range']:
+        (lon1, lat1), (lon2, lat2) = selected_data['range']['mapbox']
+        return box(min(lon1, lon2), min(lat1, lat2), max(lon1, lon2), max(lat1, lat2))
+    if 'lassoPoints' in selected_data and 'mapbox' in selected_data['lassoPoints']:
+        points = selected_data['lassoPoints']['mapbox']
+        if len(points) >= 3:
+            return Polygon(points)
+    return None
 
 
 def decode(contents):
@@ -130,7 +207,7 @@ def decode(contents):
 
 
 def validate_extension(dict_extension, filename):
-    if filename.endswith(('.html', '.js', '.htm', '.svg')):
+    if filename.lower().endswith(DISALLOWED_EXTENSIONS):
         raise Exception("Filename extension not allowed")
     elif dict_extension == 'shp':
         if not filename.endswith('.zip'):
@@ -139,37 +216,73 @@ def validate_extension(dict_extension, filename):
         raise Exception("Filename extension not valid for this catalogue item")
 
 
-def validate_shapefile_directory(dir_path):
-    # List only files (ignore subdirectories)
-    all_entries = os.listdir(dir_path)
-    files = [f for f in all_entries if
-             os.path.isfile(os.path.join(dir_path, f))]
-
-    # Max‑8 check
-    if len(files) > 8:
-        raise ValueError(
-            f"Directory contains {len(files)} files; maximum allowed is 8.")
-
-    if any(f.endswith(('.html', '.js', '.htm', '.svg')) for f in files):
-        raise ValueError(f"Extension not allowed")
-
-    # Unique extensions check
-    exts = [os.path.splitext(f)[1].lower() for f in files]
-    dup_exts = [ext for ext, count in Counter(exts).items() if count > 1]
-    if dup_exts:
-        raise ValueError(
-            f"Duplicate extensions found: {dup_exts}. Each file must have a unique extension.")
-
-    # Required‑count check for the four target extensions
-    required = {'.shp', '.shx', '.dbf', '.prj'}
-    found = set(exts)
-    missing = required - found
-    if missing:
-        raise ValueError(
-            f"Missing required extension(s): {sorted(missing)}. Need at least one of each {sorted(required)}.")
-
-    # All checks passed
-    return True
+def validate_archive(infos):
+    """Reject a zip from its central directory, before anything is
+    inflated, if a member could be written outside the directory it is
+    read from, or the members number more than ARCHIVE_MAX_MEMBERS, total
+    more than ARCHIVE_MAX_SIZE, or more than ARCHIVE_RATIO_MIN_SIZE and
+    ARCHIVE_MAX_RATIO times their compressed size. Raises ArchiveRejected."""
+    if len(infos) > ARCHIVE_MAX_MEMBERS:
+        raise ArchiveRejected(
+            f"Archive has {len(infos)} members; maximum allowed is {ARCHIVE_MAX_MEMBERS}.")
+    total = compressed = 0
+    for info in infos:
+        name = info.filename
+        if name.startswith('/') or '..' in name.split('/') or '\\' in name:
+            raise ArchiveRejected(f"Archive member name not allowed: {name}")
+        total += info.file_size
+        compressed += info.compress_size
+    if total > ARCHIVE_MAX_SIZE:
+        raise ArchiveRejected(
+            f"Archive contents are {total} bytes; maximum allowed is {ARCHIVE_MAX_SIZE}.")
+    if total > ARCHIVE_RATIO_MIN_SIZE and total > max(compressed, 1) * ARCHIVE_MAX_RATIO:
+        raise ArchiveRejected("Archive is compressed too far to be accepted")
+
+
+def validate_shapefile_archive(infos):
+    """Check zipped shapefiles from the central directory and return the
+    names of their .shp members. Each .shp is checked with the files of the
+    same name beside it, as a shapefile directory was: at most 8, unique
+    extensions and one of each of the required extensions."""
+    validate_archive(infos)
+    files = [
+        i.filename for i in infos
+        if not i.is_dir() and not i.filename.startswith('__MACOSX/')
+    ]
+
+    if any(f.lower().endswith(DISALLOWED_EXTENSIONS) for f in files):
+        raise ArchiveRejected(".zip contains a file which is not allowed")
+
+    shapefiles = {}
+    for f in files:
+        stem, ext = os.path.splitext(f)
+        shapefiles.setdefault(stem, []).append(ext.lower())
+    shp_list = [f for f in files if os.path.splitext(f)[1].lower() == '.shp']
+    if not shp_list:
+        raise ValueError("No .shp found in archive")
+
+    for shp in shp_list:
+        exts = shapefiles[os.path.splitext(shp)[0]]
+
+        # Max‑8 check
+        if len(exts) > 8:
+            raise ValueError(
+                f"Shapefile {shp} has {len(exts)} files; maximum allowed is 8.")
+
+        # Unique extensions check
+        dup_exts = [ext for ext, count in Counter(exts).items() if count > 1]
+        if dup_exts:
+            raise ValueError(
+                f"Duplicate extensions found for {shp}: {dup_exts}. Each file must have a unique extension.")
+
+        # Required‑count check for the four target extensions
+        required = {'.shp', '.shx', '.dbf', '.prj'}
+        missing = required - set(exts)
+        if missing:
+            raise ValueError(
+                f"Missing required extension(s) for {shp}: {sorted(missing)}. Need at least one of each {sorted(required)}.")
+
+    return shp_list
 
 
 def validate_mime(mime_type, io_decoded):
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the app's modules import each other by name from dashboard/code, as they
+# do in the image
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'code'))
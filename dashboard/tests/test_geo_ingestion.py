@@ -0,0 +1,141 @@
+import struct
+
+import pytest
+
+import geo_ingestion
+
+# TIFF field types
+SHORT, LONG, DOUBLE, LONG8 = 3, 4, 12, 16
+
+
+def reader(data):
+    def read(offset, length):
+        return data[offset:offset + length]
+    return read
+
+
+def tiff(tags, order='<', big=False):
+    """A TIFF, or BigTIFF if big, with one image directory holding tags,
+    {tag: (type, values)}, with values too long to fit in an entry after
+    the directory."""
+    formats = {SHORT: 'H', LONG: 'I', DOUBLE: 'd', LONG8: 'Q'}
+    if big:
+        header = (b'II' if order == '<' else b'MM') + struct.pack(order + 'HHHQ', 43, 8, 0, 16)
+        count_format, entry_format, inline, offset_format = 'Q', 'HHQ', 8, 'Q'
+    else:
+        header = (b'II' if order == '<' else b'MM') + struct.pack(order + 'HI', 42, 8)
+        count_format, entry_format, inline, offset_format = 'H', 'HHI', 4, 'I'
+    entry_size = struct.calcsize(order + entry_format) + inline
+    directory_size = (struct.calcsize(order + count_format) + len(tags) * entry_size
+                      + struct.calcsize(order + offset_format))
+    extra_offset = len(header) + directory_size
+
+    entries = struct.pack(order + count_format, len(tags))
+    extra = b''
+    for tag, (kind, values) in sorted(tags.items()):
+        value = struct.pack(f"{order}{len(values)}{formats[kind]}", *values)
+        entries += struct.pack(order + entry_format, tag, kind, len(values))
+        if len(value) <= inline:
+            entries += value.ljust(inline, b'\0')
+        else:
+            entries += struct.pack(order + offset_format, extra_offset + len(extra))
+            extra += value
+    entries += struct.pack(order + offset_format, 0)
+    return header + entries + extra
+
+
+def geotiff_tags(raster_type=1, epsg=27700):
+    # 100 x 50 pixels of 10 m, top left corner at (400000, 300000)
+    return {
+        geo_ingestion.TIFF_IMAGE_WIDTH: (SHORT, [100]),
+        geo_ingestion.TIFF_IMAGE_LENGTH: (LONG, [50]),
+        geo_ingestion.TIFF_MODEL_PIXEL_SCALE: (DOUBLE, [10.0, 10.0, 0.0]),
+        geo_ingestion.TIFF_MODEL_TIEPOINT: (DOUBLE, [0, 0, 0, 400000.0, 300000.0, 0]),
+        geo_ingestion.TIFF_GEO_KEY_DIRECTORY: (SHORT, [
+            1, 1, 0, 2,
+            geo_ingestion.GEOKEY_RASTER_TYPE, 0, 1, raster_type,
+            geo_ingestion.GEOKEY_PROJECTED_TYPE, 0, 1, epsg,
+        ]),
+    }
+
+
+@pytest.mark.parametrize('order, big', [('<', False), ('>', False), ('<', True), ('>', True)],
+                         ids=['little-endian', 'big-endian', 'bigtiff', 'big-endian-bigtiff'])
+def test_geotiff(order, big):
+    outline, epsg = geo_ingestion.geotiff(reader(tiff(geotiff_tags(), order, big)))
+    assert outline.bounds == (400000.0, 299500.0, 401000.0, 300000.0)
+    assert epsg == 27700
+
+
+def test_geotiff_pixel_is_point():
+    data = tiff(geotiff_tags(raster_type=geo_ingestion.RASTER_PIXEL_IS_POINT))
+    outline, _ = geo_ingestion.geotiff(reader(data))
+    assert outline.bounds == (399995.0, 299505.0, 400995.0, 300005.0)
+
+
+def test_geotiff_transformation():
+    tags = geotiff_tags()
+    del tags[geo_ingestion.TIFF_MODEL_PIXEL_SCALE]
+    del tags[geo_ingestion.TIFF_MODEL_TIEPOINT]
+    tags[geo_ingestion.TIFF_MODEL_TRANSFORMATION] = (DOUBLE, [
+        10, 0, 0, 400000, 0, -10, 0, 300000, 0, 0, 0, 0, 0, 0, 0, 1,
+    ])
+    outline, _ = geo_ingestion.geotiff(reader(tiff(tags, '>')))
+    assert outline.bounds == (400000.0, 299500.0, 401000.0, 300000.0)
+
+
+def test_geotiff_without_crs():
+    tags = geotiff_tags(epsg=geo_ingestion.GEOKEY_USER_DEFINED)
+    assert geo_ingestion.geotiff(reader(tiff(tags)))[1] is None
+
+
+def test_geotiff_without_georeferencing():
+    tags = geotiff_tags()
+    del tags[geo_ingestion.TIFF_MODEL_TIEPOINT]
+    with pytest.raises(ValueError, match='georeferencing'):
+        geo_ingestion.geotiff(reader(tiff(tags)))
+
+
+def test_not_a_tiff():
+    with pytest.raises(ValueError, match='Not a TIFF'):
+        geo_ingestion.tiff_tags(reader(b'GIF89a' + b'\0' * 10), {256})
+
+
+def test_raster_reprojects():
+    extents, levels = geo_ingestion.raster('grid.tif', reader(tiff(geotiff_tags())))
+    assert extents.startswith('POLYGON ((-1.')
+    assert set(levels) == set(geo_ingestion.FOOTPRINT_COLUMNS)
+
+
+ASCII_GRID = b"""ncols 4
+nrows 2
+%s
+cellsize 5
+NODATA_value -9999
+1 2 3 4
+5 6 7 8
+"""
+
+
+@pytest.mark.parametrize('origin', [b'xllcorner 100\nyllcorner 200', b'xllcenter 102.5\nyllcenter 202.5'],
+                         ids=['corner', 'center'])
+def test_ascii_grid(origin):
+    outline, crs = geo_ingestion.ascii_grid(reader(ASCII_GRID % origin))
+    assert outline.bounds == (100.0, 200.0, 120.0, 210.0)
+    assert crs is None
+
+
+def test_ascii_grid_dx_dy():
+    data = b"ncols 4\nnrows 2\nxllcorner 0\nyllcorner 0\ndx 2\ndy 3\n1 2 3 4\n"
+    assert geo_ingestion.ascii_grid(reader(data))[0].bounds == (0.0, 0.0, 8.0, 6.0)
+
+
+@pytest.mark.parametrize('header', [
+    b"nrows 2\nxllcorner 0\nyllcorner 0\ncellsize 5\n",
+    b"ncols 4\nnrows 2\nxllcorner 0\ncellsize 5\n",
+    b"ncols 4\nnrows 2\nxllcorner 0\nyllcorner 0\n",
+    b"ncols 4\nnrows 2\nxllcenter 0\nyllcenter 0\n",
+], ids=['no-ncols', 'no-yllcorner', 'no-cellsize', 'center-no-cellsize'])
+def test_ascii_grid_missing_keys(header):
+    with pytest.raises(ValueError):
+        geo_ingestion.ascii_grid(reader(header + b"1 2 3 4\n"))
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects.postgresql import psycopg2
+
+import tiles
+from query_cache import QueryCache, MemoryBackend
+
+# a tile as psycopg2 returns bytea, before SQLAlchemy processes it
+RAW_TILE = memoryview(b'\x1a\x0bfootprints\x78\x02')
+
+
+def shared_cache(backend):
+    cache = QueryCache('TILE_CACHE')
+    cache.backend = backend
+    cache.ttl = 60
+    cache.wait = 1
+    return cache
+
+
+def test_tile_query_is_binary():
+    q = tiles.tile_query(3, 1, 2, 'active')
+    assert isinstance(q.selected_columns[0].type, LargeBinary)
+
+
+def test_tile_round_trips_through_shared_backend():
+    q = tiles.tile_query(3, 1, 2, 'active')
+    process = q.selected_columns[0].type.result_processor(psycopg2.dialect(), None)
+    tile = process(RAW_TILE)
+
+    backend = MemoryBackend(16)
+    cache = shared_cache(backend)
+    assert cache._shared('tiles', 'key', ['object_store_metadata'], lambda: tile) == tile
+    assert cache._stats['tiles']['errors'] == 0
+
+    # another worker finds it in the backend rather than running the query
+    other = shared_cache(backend)
+    value = other._shared(
+        'tiles', 'key', ['object_store_metadata'], lambda: pytest.fail('tile computed again')
+    )
+    assert value == bytes(RAW_TILE)
+    assert other._stats['tiles']['shared_hits'] == 1
@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import subprocess
+
+import plotly
+import pytest
+from dash import no_update
+
+import ui
+
+UI_JS = os.path.join(os.path.dirname(__file__), os.pardir, 'code', 'assets', 'ui.js')
+NO_UPDATE = '__no_update__'
+
+# loads assets/ui.js as the browser would and runs the calls on stdin, each
+# [function name, arguments], printing their results
+RUNNER = """
+const fs = require('fs');
+global.window = {dash_clientside: {no_update: '%s'}};
+eval(fs.readFileSync(process.argv[1], 'utf8'));
+const calls = JSON.parse(fs.readFileSync(0, 'utf8'));
+const results = calls.map(([name, args]) => window.dash_clientside.ui[name](...args));
+process.stdout.write(JSON.stringify(results));
+""" % NO_UPDATE
+
+# sizes across every unit, including ones which round at exact halves
+SIZES = [0, 1, 512, 1023, 1024, 1152, 1535, 1536, 10 ** 6, 2 ** 20 + 5 * 2 ** 10,
+         123456789, 2 ** 30, 5 * 2 ** 40, 3 * 2 ** 50 + 2 ** 47]
+FILES = [{'uuid': str(i), 'size': size} for i, size in enumerate(SIZES)]
+PAGE_1, PAGE_2 = FILES[:4], FILES[4:8]
+
+CATALOGUE = {'etag': 'abc', 'records': [
+    {'uuid': '0b7c6e4a-1d2f-4c4e-9a51-3f0c2b1e8d01', 'name': 'River levels',
+     'model_domain': 'Hydrology', 'relation_type': 'input', 'gis': True,
+     'filename_extensions': ['shp', 'dbf'], 'produced_by': ['EA'],
+     'ingested_by': ['a@example.com'], 'modified_by': [], 'size': 1536},
+    {'uuid': '5f2d9a10-77b3-4e0c-8d2a-6a4b1c9e0f12', 'name': 'Rainfall radar grid',
+     'model_domain': 'Meteorology', 'relation_type': 'output', 'gis': False,
+     'filename_extensions': ['asc'], 'produced_by': ['Met Office', 'EA'],
+     'ingested_by': ['b@example.com'], 'modified_by': ['a@example.com'], 'size': 7},
+    {'uuid': 'c3a1e8f4-0d6b-4a27-b5e9-8e7f2d4c6a33', 'name': 'Land use',
+     'model_domain': None, 'relation_type': 'input', 'gis': True,
+     'filename_extensions': ['tif'], 'produced_by': [],
+     'ingested_by': ['a@example.com'], 'modified_by': None, 'size': 0},
+]}
+NO_FILTERS = ('', '', [], [], [], [], [], [], None)
+HIDDEN = ['filename_extensions', 'produced_by']
+
+
+def filters(**changes):
+    names = ['name', 'uuid', 'domain', 'extensions', 'relation', 'produced_by',
+             'ingested_by', 'modified_by', 'gis']
+    values = dict(zip(names, NO_FILTERS), **changes)
+    return tuple(values[name] for name in names)
+
+
+def filter_call(selected_rows=None, data=None, hidden=HIDDEN, store=CATALOGUE, **changes):
+    return (store, 1, *filters(**changes), hidden, selected_rows, data or [])
+
+
+FIXTURES = [
+    ('filesTitle', ui.files_title, [None, {'total': 0}, {'total': 12}]),
+    ('spatialSearchTitle', ui.spatial_search_title, [None, {'total': 3}]),
+    ('textSearchTitle', ui.text_search_title, [None, {'total': 1500}]),
+    ('downloadTitle', ui.download_title, [None, [], [0], [0, 4, 7]]),
+    ('selectionButtons', ui.selection_buttons, [None, [], [2], [1, 2]]),
+    ('estimatedSize', ui.estimated_size,
+     [None] + [[f] for f in FILES] + [FILES[1:4], FILES]),
+    ('downloadButton', ui.download_button,
+     [None, []] + [[f] for f in FILES] + [FILES[:10], FILES[:11]]),
+    ('selectedFiles', ui.selected_files, [
+        (None, PAGE_1, None),
+        ([], PAGE_1, []),
+        ([1, 0], PAGE_1, None),
+        ([0, 1], PAGE_1, PAGE_1[:2]),
+        # selections on other pages are kept when this page's selection changes
+        ([0], PAGE_2, PAGE_1[:2]),
+        ([], PAGE_2, PAGE_1[:2] + PAGE_2[:1]),
+        ([2], PAGE_1, PAGE_1[:2] + PAGE_2[:1]),
+        # a page being shown again with its selected rows
+        ([0, 1], PAGE_1, PAGE_1[:2] + PAGE_2[:1]),
+        ([], [], PAGE_1[:1]),
+    ]),
+    ('uploadName', ui.upload_name, [None, 'model.zip']),
+    ('uploadButton', ui.upload_button,
+     [(None, None), (None, [0]), ('model.zip', None), ('model.zip', []), ('model.zip', [0])]),
+    ('showHelp', ui.show_help, [None, 1]),
+    ('catalogueOptions', ui.catalogue_options, [None, {'etag': '', 'records': []}, CATALOGUE]),
+    ('filterCatalogue', ui.filter_catalogue, [
+        filter_call(store=None),
+        filter_call(),
+        filter_call(hidden=None),
+        filter_call(name='RAIN'),
+        filter_call(uuid='c3a1'),
+        filter_call(domain=['Hydrology', 'Meteorology']),
+        filter_call(extensions=['dbf', 'tif']),
+        filter_call(relation=['output']),
+        filter_call(produced_by=['EA']),
+        filter_call(ingested_by=['b@example.com']),
+        filter_call(modified_by=['a@example.com']),
+        filter_call(gis='true'),
+        filter_call(gis='false'),
+        filter_call(name='land', gis='true', relation=['input']),
+        filter_call(name='nothing matches'),
+        # the selected item stays selected, moved, or is dropped when hidden
+        filter_call([0], CATALOGUE['records']),
+        filter_call([2], CATALOGUE['records'], gis='true'),
+        filter_call([1], CATALOGUE['records'], gis='true'),
+        filter_call([], CATALOGUE['records']),
+    ]),
+]
+
+
+def cases():
+    for name, reference, inputs in FIXTURES:
+        for args in inputs:
+            if not isinstance(args, tuple):
+                args = (args,)
+            yield name, reference, list(args)
+
+
+def as_json(value):
+    # what the reference returns, as dash would send it to the browser
+    if value is no_update:
+        return NO_UPDATE
+    if isinstance(value, (list, tuple)):
+        return [as_json(v) for v in value]
+    return json.loads(json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+@pytest.fixture(scope='module')
+def clientside():
+    if shutil.which('node') is None:
+        pytest.skip('node is not installed')
+    calls = [[name, args] for name, _, args in cases()]
+    result = subprocess.run(
+        ['node', '-e', RUNNER, UI_JS], input=json.dumps(calls),
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize(
+    'index, case', list(enumerate(cases())),
+    ids=[f"{name}-{index}" for index, (name, _, _) in enumerate(cases())]
+)
+def test_clientside_matches_reference(clientside, index, case):
+    name, reference, args = case
+    assert clientside[index] == as_json(reference(*args))
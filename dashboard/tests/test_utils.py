@@ -0,0 +1,58 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+import utils
+
+
+def archive(members):
+    """Central directory entries of a deflated zip of members, {name: bytes}."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return zipfile.ZipFile(buffer).infolist()
+
+
+def shapefile(dbf):
+    return {
+        'roads.shp': os.urandom(4096),
+        'roads.shx': os.urandom(512),
+        'roads.prj': b'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984"]]',
+        'roads.dbf': dbf,
+    }
+
+
+def test_sparse_dbf_is_accepted():
+    # a .dbf of mostly blank fields inflates far more than ARCHIVE_MAX_RATIO
+    dbf = b'\x03' + b'\0' * 31 + b' ' * 400_000
+    infos = archive(shapefile(dbf))
+    dbf_info = next(i for i in infos if i.filename == 'roads.dbf')
+    assert dbf_info.file_size > dbf_info.compress_size * utils.ARCHIVE_MAX_RATIO
+    assert utils.validate_shapefile_archive(infos) == ['roads.shp']
+
+
+def test_zip_bomb_is_rejected():
+    infos = archive(shapefile(b'\0' * 8 * 2 ** 20))
+    with pytest.raises(utils.ArchiveRejected, match='compressed too far'):
+        utils.validate_archive(infos)
+
+
+def test_bomb_across_members_is_rejected():
+    infos = archive({f'part{i}.dbf': b'\0' * 2 ** 19 for i in range(8)})
+    with pytest.raises(utils.ArchiveRejected, match='compressed too far'):
+        utils.validate_archive(infos)
+
+
+@pytest.mark.parametrize('name', ['/etc/passwd', '../roads.shp', 'a/../../b', 'a\\b'])
+def test_member_outside_directory_is_rejected(name):
+    with pytest.raises(utils.ArchiveRejected, match='not allowed'):
+        utils.validate_archive(archive({name: b'x'}))
+
+
+def test_too_many_members_is_rejected():
+    infos = archive({f'{i}.txt': b'' for i in range(utils.ARCHIVE_MAX_MEMBERS + 1)})
+    with pytest.raises(utils.ArchiveRejected, match='members'):
+        utils.validate_archive(infos)